@@ -1,7 +1,18 @@
 from .bagel import Bagel
 from .integration import BagelIntegration
-from .data import Bite
+from .data import Bite, ColumnarData
 from .table import Table
 from .datadog_logs import DataDogLogSubmitter
+from .stream import stream_json_bites
+from .util import filter_by_timestamp
 
-__all__ = ["Bagel", "BagelIntegration", "Bite", "Table", "DataDogLogSubmitter"]
+__all__ = [
+    "Bagel",
+    "BagelIntegration",
+    "Bite",
+    "ColumnarData",
+    "Table",
+    "DataDogLogSubmitter",
+    "stream_json_bites",
+    "filter_by_timestamp",
+]
@@ -1,12 +1,16 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import os
 import traceback
-from typing import Generator, List, Optional, Union
+from datetime import datetime
+from typing import Dict, Generator, List, Optional, Sized, Tuple, Union
 
 import yaml
 
 from .base_clients import StorageClient, TimeboxClient
 from .clients import AzureBlobClient, AzureTableClient
-from .data import Bite
+from .data import Bite, is_stream
 from .errors import BagelError
 from .integration import BagelIntegration
 from .logger import BagelLogger
@@ -14,12 +18,15 @@ from .table import Table
 from .util import (
     extract_date_ranges,
     format_blob_name,
-    format_dict_to_json_binary,
     format_timestamp_to_str,
     get_current_timestamp,
+    serialize_bite_data,
 )
 from .datadog_logs import DataDogLogSubmitter
 
+# key of the mid-window checkpoint in the timebox state
+CHECKPOINT_KEY = "checkpoint"
+
 
 class Bagel:
     def __init__(
@@ -27,8 +34,16 @@ class Bagel:
         integration: BagelIntegration,
         timebox_client: TimeboxClient = None,
         storage_client: StorageClient = None,
+        serialize_workers: int = 0,
+        serialize_threshold: int = 10000,
     ):
-        """🥯🥯🥯"""
+        """🥯🥯🥯
+
+        `serialize_workers` > 0 formats and compresses Bites with at least
+        `serialize_threshold` rows in that many worker processes, so CPU-bound
+        encoding doesn't hold the GIL while other Bites are fetched and uploaded.
+        Smaller Bites, bytes and streamed payloads are always handled in-process.
+        """
 
         self.logger = BagelLogger()
 
@@ -37,23 +52,38 @@ class Bagel:
         self.timebox_client = timebox_client if timebox_client else AzureTableClient()
         self.storage_client = storage_client if storage_client else AzureBlobClient()
 
+        self.serialize_workers = serialize_workers
+        self.serialize_threshold = serialize_threshold
+        self._serialize_pool: Optional[ProcessPoolExecutor] = None
+
     def run(self):
 
         errors: List[BagelError] = []
 
         tables = self.get_table_list()
 
-        for t in tables:
+        if self.serialize_workers > 0:
+            self._serialize_pool = ProcessPoolExecutor(self.serialize_workers)
+
+        try:
+            for t in tables:
 
-            try:
-                self._run_table(t)
-                self._log_datadog_info(self.integration.source, t.name)
+                try:
+                    self._run_table(t)
+                    self._log_datadog_info(self.integration.source, t.name)
 
-            except Exception as e:
-                errors.append(traceback.format_exc())
-                self.logger.error(e)
-                self._log_datadog_error(e, self.integration.source, t.name)
-                self.logger.error(traceback.format_exc())
+                except Exception as e:
+                    errors.append(traceback.format_exc())
+                    self.logger.error(e)
+                    self._log_datadog_error(e, self.integration.source, t.name)
+                    self.logger.error(traceback.format_exc())
+
+        finally:
+            if self._serialize_pool:
+                self._serialize_pool.shutdown(wait=True)
+                self._serialize_pool = None
+            self.integration.cache.clear()
+            self.integration.close()
 
         if errors:
             raise BagelError(errors)
@@ -77,17 +107,39 @@ class Bagel:
         self.logger.info(f"Current Timestamp: {current_timestamp}")
         self.logger.info(f"Last Run Timestamp: {last_run_timestamp}")
 
-        date_ranges = extract_date_ranges(
-            last_run_timestamp,
-            current_timestamp,
-            table.historical_batch,
-            table.historical_frequency,
-        )
+        table.state = self.timebox_client.get_state(self.integration.source, table.name)
+        if table.state:
+            self.logger.info(f"Last State: {table.state}")
+
+        checkpoint = table.state.pop(CHECKPOINT_KEY, None)
+
+        if checkpoint:
+            # finish the window the last run stopped in before moving on
+            window_end = datetime.fromisoformat(checkpoint["window_end"])
+            self.logger.info(f"Resuming window ending {window_end}: {checkpoint}")
+            date_ranges = [last_run_timestamp] + list(
+                extract_date_ranges(
+                    window_end,
+                    current_timestamp,
+                    table.historical_batch,
+                    table.historical_frequency,
+                )
+            )
+        else:
+            date_ranges = extract_date_ranges(
+                last_run_timestamp,
+                current_timestamp,
+                table.historical_batch,
+                table.historical_frequency,
+            )
 
         for i in range(len(date_ranges) - 1):
             lr_t = date_ranges[i]
             c_t = date_ranges[i + 1]
 
+            # only the first window can be a resumed one
+            table.resume_state = checkpoint["resume"] if checkpoint and i == 0 else None
+
             integration_data = self.integration.get_data(
                 table, last_run_timestamp=lr_t, current_timestamp=c_t
             )
@@ -96,22 +148,14 @@ class Bagel:
             self._validate_data(integration_data)
             data = self._bite_to_iterable(integration_data)
 
-            counter = 0
-            data_log = []
-            for bite in data:
-
-                file_name = self._upload_bite(
-                    self.integration.source, table.name, bite, table.file_format
-                )
-                data_log.append(file_name)
-
-                counter += 1
+            data_log = self._upload_bites(table, data, window=(lr_t, c_t))
+            counter = len(data_log)
 
             self.logger.info(f"Uploaded {counter} Rows / Files: {data_log}")
 
             # overwrite last run timestamp
             write_result = self.timebox_client.write_run_timestamp(
-                self.integration.source, table.name, c_t
+                self.integration.source, table.name, c_t, state=table.state
             )
 
             self.logger.info(f"Timebox write result: {write_result}")
@@ -159,23 +203,135 @@ class Bagel:
 
         return data
 
-    def _upload_bite(
-        self, src_system, table_name: str, bite: Bite, file_format: Optional[str] = None
+    def _upload_bites(
+        self, table: Table, data, window: Optional[Tuple[datetime, datetime]] = None
+    ) -> List[str]:
+        """Serializes Bites ahead (in worker processes when offloading) and keeps
+        up to `table.upload_concurrency` uploads running at once. Uploads still
+        complete in the order the Bites were yielded.
+
+        Bites with an `index_key` whose fingerprint is already in the timebox
+        index are skipped before their data is read. The `checkpoint` of a Bite
+        is saved once it and every Bite before it are uploaded."""
+        upload_concurrency = table.upload_concurrency or 1
+        max_pending = self.serialize_workers + upload_concurrency - 1
+        upload_pool = (
+            ThreadPoolExecutor(upload_concurrency) if upload_concurrency > 1 else None
+        )
+        index = None
+
+        def start(bite: Bite):
+            formatted_data = self._serialize_bite(bite, table)
+            if upload_pool:
+                upload = upload_pool.submit(
+                    self._upload_bite, table, bite, formatted_data
+                )
+            else:
+                upload = partial(self._upload_bite, table, bite, formatted_data)
+            return bite, upload, formatted_data
+
+        def finish(bite: Bite, upload, formatted_data) -> str:
+            file_name = upload.result() if isinstance(upload, Future) else upload()
+            if self._is_indexed(bite):
+                self.timebox_client.write_index_entry(
+                    self.integration.source,
+                    table.name,
+                    bite.index_key,
+                    bite.fingerprint,
+                )
+            if bite.checkpoint is not None and window:
+                self._write_checkpoint(table, window, bite.checkpoint)
+            return file_name
+
+        data_log = []
+        skipped = 0
+        pending = deque()
+        try:
+            for bite in data:
+
+                if self._is_indexed(bite):
+                    if index is None:
+                        index = self.timebox_client.get_index(
+                            self.integration.source, table.name
+                        )
+                    if index.get(bite.index_key) == bite.fingerprint:
+                        self._close_stream(bite)
+                        skipped += 1
+                        continue
+
+                pending.append(start(bite))
+                if len(pending) > max_pending:
+                    data_log.append(finish(*pending.popleft()))
+
+            while pending:
+                data_log.append(finish(*pending.popleft()))
+
+        finally:
+            # `shutdown(cancel_futures=True)` needs Python 3.9, so whatever hasn't
+            # started yet is cancelled by hand
+            for _, upload, formatted_data in pending:
+                for future in [upload, formatted_data]:
+                    if isinstance(future, Future):
+                        future.cancel()
+            if upload_pool:
+                upload_pool.shutdown(wait=True)
+
+        if skipped:
+            self.logger.info(f"Skipped {skipped} Bites already in the index")
+
+        return data_log
+
+    def _write_checkpoint(
+        self, table: Table, window: Tuple[datetime, datetime], resume: Dict
     ):
+        """Saves where to resume the window from. The timestamp stays at the start
+        of the window, so a failed run picks the same window up again."""
+        lr_t, c_t = window
+        state = {
+            **table.state,
+            CHECKPOINT_KEY: {"window_end": c_t.isoformat(), "resume": resume},
+        }
+        self.timebox_client.write_run_timestamp(
+            self.integration.source, table.name, lr_t, state=state
+        )
+
+    def _is_indexed(self, bite: Bite) -> bool:
+        return bool(bite.index_key and bite.fingerprint)
+
+    def _close_stream(self, bite: Bite):
+        # a generator that was never started makes no request when closed
+        if is_stream(bite.data) and hasattr(bite.data, "close"):
+            bite.data.close()
+
+    def _bite_size(self, bite: Bite) -> int:
+        """Row count of tabular data; bytes and streams count as 0 rows."""
+        if isinstance(bite.data, bytes) or not isinstance(bite.data, Sized):
+            return 0
+        return len(bite.data)
+
+    def _serialize_bite(self, bite: Bite, table: Table) -> Union[bytes, Future]:
+        if self._serialize_pool and self._bite_size(bite) >= self.serialize_threshold:
+            return self._serialize_pool.submit(
+                serialize_bite_data, bite.data, table.file_format, table.compression
+            )
+
+        return serialize_bite_data(bite.data, table.file_format, table.compression)
+
+    def _upload_bite(
+        self, table: Table, bite: Bite, formatted_data: Union[bytes, Future]
+    ) -> str:
         # generate file_name
         file_name = format_blob_name(
-            src_system,
-            table_name,
+            self.integration.source,
+            table.name,
             get_current_timestamp(),
-            file_format=file_format,
+            file_format=table.file_format,
             file_name=bite.file_name,
+            compression=table.compression,
         )
 
-        formatted_data = (
-            format_dict_to_json_binary(bite.data)
-            if file_format in ["json", None]
-            else bite.data
-        )
+        if isinstance(formatted_data, Future):
+            formatted_data = formatted_data.result()
 
         self.storage_client.upload_data(file_name, formatted_data)
         return file_name
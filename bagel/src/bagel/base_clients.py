@@ -1,9 +1,12 @@
 import abc
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 from bagel.util import get_current_timestamp
 
+# small JSON-serializable blob (cursors, sync tokens, page numbers) saved per table
+TimeboxState = Dict[str, Any]
+
 
 class ClientInterface:  # pragma: nocover
     def connect(self):
@@ -33,13 +36,34 @@ class TimeboxClient(ClientInterface, metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
     def write_run_timestamp(
-        self, system: str, table: str, timestamp: datetime
+        self,
+        system: str,
+        table: str,
+        timestamp: datetime,
+        state: Optional[TimeboxState] = None,
     ):  # pragma: nocover
+        """Writes `state` together with `timestamp`, so one is never saved without
+        the other. `state=None` leaves the saved state as it is."""
         pass
 
+    def get_state(self, system: str, table: str) -> TimeboxState:
+        """Returns the state written with the last run timestamp. Clients that
+        don't store one return `{}`, so integrations fall back to the timestamp."""
+        return {}
+
     def get_current_timestamp(self) -> datetime:
         return get_current_timestamp()
 
+    def get_index(self, system: str, table: str) -> Dict[str, str]:
+        """Returns `{index_key: fingerprint}` for everything already landed for the
+        table. Clients that don't keep an index return `{}`, so nothing is skipped."""
+        return {}
+
+    def write_index_entry(
+        self, system: str, table: str, index_key: str, fingerprint: str
+    ):  # pragma: nocover
+        pass
+
     def get_timebox(
         self, system: str, table: str, initial_timestamp: Optional[datetime] = None
     ) -> Tuple[datetime, datetime]:
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class RunCache:
+    """Keyed memoization shared by every table of one integration for the length
+    of a Bagel run, so upstream results several tables need are fetched once.
+
+    With `max_items` set, only that many results are kept in memory; the least
+    recently used ones are pickled to a temporary directory (`spill_dir`, or one
+    made by `tempfile`) and loaded back when asked for again. `clear()` drops
+    everything, including spilled files, and Bagel calls it when the run ends.
+
+    Safe to use from several threads: concurrent callers of the same key wait for
+    a single computation instead of repeating it.
+    """
+
+    def __init__(
+        self, max_items: Optional[int] = None, spill_dir: Optional[str] = None
+    ):
+        if max_items is not None and max_items < 1:
+            raise ValueError("max_items must be at least 1")
+
+        self.max_items = max_items
+        self.spill_dir = spill_dir
+        self._memory: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._spilled: Dict[Hashable, str] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.RLock()
+        self._tmp_dir: Optional[str] = None
+
+    def get_or_compute(self, key: Hashable, func: Callable[..., Any], *args, **kwargs):
+        """Returns the cached result for `key`, calling `func(*args, **kwargs)` the
+        first time. Generators should be materialized (e.g. `list(...)`) by `func`,
+        since a generator can only be consumed once."""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self:
+                    return self._get(key)
+
+            value = func(*args, **kwargs)
+
+            with self._lock:
+                self._set(key, value)
+
+            return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._spilled
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._memory) + len(self._spilled)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._spilled.clear()
+            self._key_locks.clear()
+            if self._tmp_dir:
+                shutil.rmtree(self._tmp_dir, ignore_errors=True)
+                self._tmp_dir = None
+
+    def _get(self, key: Hashable):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        path = self._spilled.pop(key)
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+        os.remove(path)
+
+        self._set(key, value)
+        return value
+
+    def _set(self, key: Hashable, value: Any):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+
+        while self.max_items is not None and len(self._memory) > self.max_items:
+            old_key, old_value = self._memory.popitem(last=False)
+            self._spill(old_key, old_value)
+            # a spilled key is found by `key in self`, so its lock isn't needed
+            self._key_locks.pop(old_key, None)
+
+    def _spill(self, key: Hashable, value: Any):
+        if not self._tmp_dir:
+            self._tmp_dir = tempfile.mkdtemp(prefix="bagel-cache-", dir=self.spill_dir)
+
+        fd, path = tempfile.mkstemp(dir=self._tmp_dir)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._spilled[key] = path
@@ -1,18 +1,24 @@
 from datetime import datetime, timedelta
+import hashlib
+import json
 import os
-from typing import Optional, Union
+import threading
+from typing import Dict, Optional, Union
 from azure.data.tables import TableServiceClient, UpdateMode
 from azure.core.credentials import AzureNamedKeyCredential
 from azure.storage.blob import BlobServiceClient, ContainerClient
 from azure.core.exceptions import ResourceNotFoundError
 
-from .base_clients import StorageClient, TimeboxClient
+from .base_clients import StorageClient, TimeboxClient, TimeboxState
+
+MAX_STATE_LENGTH = 32_000
 
 
 class AzureTableClient(TimeboxClient):
     def __init__(self):
         self._load_config()
         self.table_client = None
+        self._entities = {}
 
     def _load_config(self):
         self.azure_storage_account = os.getenv("STORAGE_ACCOUNT")
@@ -54,10 +60,7 @@ class AzureTableClient(TimeboxClient):
         if not self.table_client:
             raise RuntimeError("Table client is not connected.")
 
-        try:
-            entity = self.table_client.get_entity(partition_key=system, row_key=table)
-        except ResourceNotFoundError:
-            entity = None
+        entity = self._get_entity(system, table)
 
         if entity:
             timestamp = str(entity["last_updated_timestamp"])
@@ -74,9 +77,41 @@ class AzureTableClient(TimeboxClient):
 
         return final_timestamp
 
-    def write_run_timestamp(self, system: str, table: str, timestamp: datetime) -> any:
+    def _get_entity(self, system: str, table: str) -> Optional[dict]:
+        try:
+            entity = self.table_client.get_entity(partition_key=system, row_key=table)
+        except ResourceNotFoundError:
+            entity = None
+
+        # `get_state` reuses the entity read by `get_last_run_timestamp`
+        self._entities[(system, table)] = entity
+        return entity
+
+    def get_state(self, system: str, table: str) -> TimeboxState:
         """
-        upserts the timestamp of the current run into the Azure table.
+        returns the state saved with the last run timestamp of the system/table.
+        """
+        if not self.table_client:
+            raise RuntimeError("Table client is not connected.")
+
+        if (system, table) in self._entities:
+            entity = self._entities[(system, table)]
+        else:
+            entity = self._get_entity(system, table)
+
+        state = entity.get("state") if entity else None
+        return json.loads(state) if state else {}
+
+    def write_run_timestamp(
+        self,
+        system: str,
+        table: str,
+        timestamp: datetime,
+        state: Optional[TimeboxState] = None,
+    ) -> any:
+        """
+        upserts the timestamp of the current run into the Azure table, with the
+        state in the same entity so both are written or neither is.
         """
         timestamp = timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
         new_entity = {
@@ -84,7 +119,58 @@ class AzureTableClient(TimeboxClient):
             "RowKey": table,
             "last_updated_timestamp": timestamp,
         }
+        if state is not None:
+            new_entity["state"] = self._format_state(state)
         self.table_client.upsert_entity(mode=UpdateMode.MERGE, entity=new_entity)
+
+        cached = self._entities.get((system, table)) or {}
+        self._entities[(system, table)] = {**cached, **new_entity}
+        return new_entity
+
+    @staticmethod
+    def _format_state(state: TimeboxState) -> str:
+        formatted = json.dumps(state, sort_keys=True, separators=(",", ":"))
+        # string properties hold up to 64KiB of UTF-16
+        if len(formatted) > MAX_STATE_LENGTH:
+            raise ValueError(
+                f"Timebox state is {len(formatted)} characters, the limit is {MAX_STATE_LENGTH}"
+            )
+        return formatted
+
+    @staticmethod
+    def _index_partition_key(system: str, table: str) -> str:
+        # kept out of the `system` partition so index rows never mix with timeboxes
+        return f"{system}-{table}-index"
+
+    def get_index(self, system: str, table: str) -> Dict[str, str]:
+        """
+        queries every index entry written for the system/table.
+        """
+        if not self.table_client:
+            raise RuntimeError("Table client is not connected.")
+
+        partition_key = self._index_partition_key(system, table)
+        entities = self.table_client.query_entities(
+            "PartitionKey eq @partition_key",
+            parameters={"partition_key": partition_key},
+            select=["index_key", "fingerprint"],
+        )
+        return {e["index_key"]: e["fingerprint"] for e in entities}
+
+    def write_index_entry(
+        self, system: str, table: str, index_key: str, fingerprint: str
+    ) -> any:
+        """
+        upserts the fingerprint of a landed item. Keys can hold characters that
+        aren't allowed in a RowKey (e.g. `/`), so the row key is their hash.
+        """
+        new_entity = {
+            "PartitionKey": self._index_partition_key(system, table),
+            "RowKey": hashlib.sha1(index_key.encode("utf-8")).hexdigest(),
+            "index_key": index_key,
+            "fingerprint": fingerprint,
+        }
+        self.table_client.upsert_entity(mode=UpdateMode.REPLACE, entity=new_entity)
         return new_entity
 
 
@@ -92,6 +178,7 @@ class AzureBlobClient(StorageClient):
     def __init__(self):
         self._load_config()
         self.container_client: Union[ContainerClient, None] = None
+        self._connect_lock = threading.Lock()
 
     def _load_config(self):
         self.azure_storage_account_connnection_string = os.getenv(
@@ -112,6 +199,7 @@ class AzureBlobClient(StorageClient):
 
     def close(self):
         self.container_client.close()
+        self.container_client = None
 
     def _connect_azure_blob(self):
         blob_service_client = BlobServiceClient.from_connection_string(
@@ -121,10 +209,16 @@ class AzureBlobClient(StorageClient):
             self.azure_container
         )
 
+    def _get_container_client(self) -> ContainerClient:
+        # one client (and connection pool) shared by every upload, including concurrent ones
+        with self._connect_lock:
+            if not self.container_client:
+                self.connect()
+            return self.container_client
+
     def _upload_data(self, file_name: str, data: any):
-        self.connect()
-        self.container_client.upload_blob(file_name, data, overwrite=True)
-        self.close()
+        """`data` can be bytes or an iterable of bytes chunks, which is streamed."""
+        self._get_container_client().upload_blob(file_name, data, overwrite=True)
 
     def upload_log(self, file_name: str, data: any):
         self._upload_data(file_name, data)
@@ -0,0 +1,91 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+import threading
+import time
+from typing import Callable, Generator, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def bounded_map(
+    func: Callable[[T], R],
+    iterable: Iterable[T],
+    max_workers: int = 4,
+    ordered: bool = True,
+) -> Generator[R, None, None]:
+    """Calls `func` on every item of `iterable` from a thread pool, keeping at
+    most `max_workers` calls in flight, and yields the results.
+
+    `iterable` is consumed lazily, so it may be infinite (e.g. page numbers):
+    stop consuming the generator (or `close()` it) and the calls that haven't
+    started are cancelled. With `ordered=True` results come back in input order,
+    otherwise as soon as they complete. The first exception raised by `func` is
+    re-raised to the caller.
+    """
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
+
+    items = iter(iterable)
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        pending = deque(pool.submit(func, item) for item in islice(items, max_workers))
+
+        try:
+            while pending:
+                if ordered:
+                    future = pending.popleft()
+                    future.result()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    future = done.pop()
+                    pending.remove(future)
+
+                for item in islice(items, 1):
+                    pending.append(pool.submit(func, item))
+
+                yield future.result()
+
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class RateLimiter:
+    """Allows at most `max_calls` calls in any `period` seconds (a sliding
+    window), shared by every thread that calls `acquire()` before a request.
+
+    Use it as `with limiter: ...` or call `limiter.acquire()`; either blocks
+    until the request fits in the quota.
+    """
+
+    def __init__(self, max_calls: int, period: float):
+        if max_calls < 1:
+            raise ValueError("max_calls must be at least 1")
+
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # waiters queue on the lock, so requests go out in the order they asked
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+
+                time.sleep(self.period - (now - self._calls[0]))
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        return False
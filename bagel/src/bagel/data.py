@@ -1,25 +1,164 @@
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Union
+from dataclasses import dataclass, field
+from itertools import compress
+import sys
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import pandas as pd
+
+
+def is_arrow_table(data) -> bool:
+    # pyarrow is optional, and nothing can be an Arrow table until it's imported
+    pa = sys.modules.get("pyarrow")
+    return pa is not None and isinstance(data, pa.Table)
+
+
+def is_stream(data) -> bool:
+    """Iterators of bytes chunks are uploaded as they are read, e.g. a file
+    downloaded with `response.iter_content()`."""
+    return isinstance(data, Iterator)
+
+
+@dataclass(eq=True, frozen=True)
+class ColumnarData:
+    """Column names plus one array per column.
+
+    Use `ColumnarData.from_rows(columns, rows)` for row tuples and
+    `ColumnarData.from_arrays(columns, arrays)` for column arrays.
+    Rows are never turned into dicts unless `records()` is called.
+    """
+
+    columns: Tuple[str, ...]
+    arrays: Tuple[Tuple[Any, ...], ...]
+
+    def __post_init__(self):
+        if len(self.columns) != len(self.arrays):
+            raise ValueError(
+                f"Got {len(self.arrays)} arrays for {len(self.columns)} columns"
+            )
+
+        if len({len(a) for a in self.arrays}) > 1:
+            raise ValueError("All column arrays must be the same length")
+
+    @classmethod
+    def from_rows(
+        cls, columns: Sequence[str], rows: Sequence[Sequence[Any]]
+    ) -> "ColumnarData":
+        columns = tuple(columns)
+        arrays = tuple(zip(*rows)) if rows else tuple(() for _ in columns)
+        return cls(columns, arrays)
+
+    @classmethod
+    def from_arrays(
+        cls, columns: Sequence[str], arrays: Sequence[Sequence[Any]]
+    ) -> "ColumnarData":
+        return cls(tuple(columns), tuple(tuple(a) for a in arrays))
+
+    def __len__(self) -> int:
+        return len(self.arrays[0]) if self.arrays else 0
+
+    def column(self, name: str) -> Tuple[Any, ...]:
+        return self.arrays[self.columns.index(name)]
+
+    def select(self, *names: str) -> "ColumnarData":
+        return ColumnarData(names, tuple(self.column(n) for n in names))
+
+    def filter(self, mask: Sequence[bool]) -> "ColumnarData":
+        """Keeps the rows where `mask` is truthy."""
+        if len(mask) != len(self):
+            raise ValueError(f"Mask length {len(mask)} != row count {len(self)}")
+
+        return ColumnarData(
+            self.columns, tuple(tuple(compress(a, mask)) for a in self.arrays)
+        )
+
+    def rows(self) -> Generator[Tuple[Any, ...], None, None]:
+        yield from zip(*self.arrays)
+
+    def records(self) -> Generator[Dict[str, Any], None, None]:
+        for row in self.rows():
+            yield dict(zip(self.columns, row))
+
+    def to_dataframe(self) -> pd.DataFrame:
+        # object dtype keeps ints next to nulls as ints instead of upcasting to float
+        return pd.DataFrame(
+            dict(zip(self.columns, self.arrays)),
+            columns=list(self.columns),
+            dtype=object,
+        )
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        return pa.table([pa.array(a) for a in self.arrays], names=list(self.columns))
+
+
+def _data_equal(a, b) -> bool:
+    # `==` on a DataFrame or Arrow table compares element-wise instead of
+    # returning a bool
+    if isinstance(a, pd.DataFrame) or is_arrow_table(a):
+        return type(a) is type(b) and a.equals(b)
+    if isinstance(b, pd.DataFrame) or is_arrow_table(b):
+        return False
+    return a == b
 
 
 @dataclass(eq=True, frozen=True)
 class Bite:
 
-    data: Union[bytes, List[Dict]]
+    data: Union[
+        bytes,
+        Iterator[bytes],
+        List[Dict],
+        ColumnarData,
+        pd.DataFrame,
+        "pyarrow.Table",
+    ]
     file_name: Optional[str] = None
+    # a Bite with both set is skipped when the timebox index already holds the same
+    # fingerprint for the key, and recorded there once it's uploaded
+    index_key: Optional[str] = None
+    fingerprint: Optional[str] = None
+    # JSON-serializable position to resume the window from once this Bite is uploaded,
+    # handed back as `table.resume_state` if the run fails before the window ends
+    checkpoint: Optional[Dict[str, Any]] = field(default=None, compare=False)
 
     def __post_init__(self):
         self._validate_content(self.data)
 
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+
+        return (
+            _data_equal(self.data, other.data)
+            and self.file_name == other.file_name
+            and self.index_key == other.index_key
+            and self.fingerprint == other.fingerprint
+        )
+
     @staticmethod
     def _validate_content(data):
 
-        if not (isinstance(data, bytes) or isinstance(data, list)):
+        if not (
+            isinstance(data, (bytes, list, ColumnarData, pd.DataFrame))
+            or is_arrow_table(data)
+            or is_stream(data)
+        ):
             raise TypeError(
-                f"Datapoint needs to be of type bytes or list. Not {type(data)}"
+                f"Datapoint needs to be of type bytes, an iterator of bytes, list, ColumnarData, DataFrame or Arrow Table. Not {type(data)}"
             )
 
         if isinstance(data, list) and len(data) > 0 and not isinstance(data[0], dict):
             raise TypeError(
-                "Bite data must be bytes or a list of dicts. If returning list of lists, use pagination/generator instead."
+                "Bite data must be bytes or a list of dicts. If returning list of lists, use ColumnarData or pagination/generator instead."
             )
@@ -1,6 +1,7 @@
 import abc
-from typing import Generator, List, Union, final
+from typing import Generator, List, Optional, Union, final
 
+from .cache import RunCache
 from .data import Bite
 from .table import Table
 
@@ -8,15 +9,24 @@ from .table import Table
 class BagelIntegration(metaclass=abc.ABCMeta):
 
     name: str
+    # results kept in memory by `self.cache` before spilling to disk; None keeps all of them in memory
+    cache_max_items: Optional[int] = None
 
     @final
     def __init__(self, **kwargs):
+        # shared by all tables of a run, and cleared by Bagel when the run ends
+        self.cache = RunCache(max_items=self.cache_max_items)
         self.__post_init__(**kwargs)
 
     def __post_init__(self, **kwargs):
         """Any initialization by the user should be handled here."""
         pass
 
+    def close(self):
+        """Called by Bagel once the run ends, whether it failed or not. Sessions
+        opened for the whole run (e.g. a login) should be ended here."""
+        pass
+
     @classmethod
     def __subclasshook__(cls, subclass):  # pragma: nocover
         return hasattr(subclass, "get_data") and callable(subclass.get_data)
@@ -0,0 +1,75 @@
+import io
+from typing import Any, Generator, Optional
+
+import ijson
+
+from .data import Bite
+
+
+def format_json_path(path: str) -> str:
+    """Translates a dotted array path (e.g. `result.*`, `0.Rows.*`) to an ijson
+    prefix (`result.item`, `item.Rows.item`).
+
+    ijson prefixes don't carry array positions, so a numeric segment matches
+    every element at that level rather than only the one at that index.
+    """
+    segments = []
+    for segment in path.split("."):
+        if segment == "*" or segment.isdigit():
+            segments.append("item")
+        elif segment:
+            segments.append(segment)
+    return ".".join(segments)
+
+
+def _to_file(source: Any):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+
+    # `requests.Response` opened with `stream=True`
+    if hasattr(source, "raw") and hasattr(source, "iter_content"):
+        source.raw.decode_content = True
+        return source.raw
+
+    if hasattr(source, "read"):
+        return source
+
+    raise TypeError(
+        f"Source must be bytes, a file-like object or a streamed response. Not {type(source)}"
+    )
+
+
+def stream_json_rows(source: Any, path: str) -> Generator[Any, None, None]:
+    """Yields the elements found at `path` one at a time while `source` is read."""
+    yield from ijson.items(_to_file(source), format_json_path(path), use_float=True)
+
+
+def stream_json_bites(
+    source: Any,
+    path: str,
+    batch_size: int = 1000,
+    file_name: Optional[str] = None,
+) -> Generator[Bite, None, None]:
+    """Parses the JSON array at `path` incrementally and yields it as Bites of at
+    most `batch_size` rows, so memory stays proportional to the batch size and
+    not to the size of the response.
+
+    Args:
+        source (requests.Response | file-like | bytes): a response requested with
+            `stream=True`, or anything with a `read()` method
+        path (str): dotted path to the array, e.g. `result.*`, `vulnerabilities.*`
+        batch_size (int): maximum number of rows per Bite
+        file_name (str): optional file name passed through to every Bite
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    batch = []
+    for row in stream_json_rows(source, path):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield Bite(batch, file_name=file_name)
+            batch = []
+
+    if batch:
+        yield Bite(batch, file_name=file_name)
@@ -1,6 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 from typing_extensions import Self
 
 
@@ -20,6 +20,14 @@ class Table:
     historical_frequency: Optional[str] = None
     file_format: Optional[str] = None
     initial_timestamp: Optional[datetime] = None
+    compression: Optional[str] = None
+    upload_concurrency: Optional[int] = None
+    # JSON-serializable state (cursors, sync tokens, ...) saved by the last run;
+    # integrations update it and Bagel persists it with the run timestamp
+    state: Dict[str, Any] = field(default_factory=dict, compare=False)
+    # `checkpoint` of the last Bite uploaded when the window being run failed part
+    # way in a previous run; None when the window starts from the beginning
+    resume_state: Optional[Dict[str, Any]] = field(default=None, compare=False)
 
     def __post_init__(self):
         self.name = self._format_table_name(self.name)
@@ -30,6 +38,11 @@ class Table:
     def __str__(self) -> str:
         return self.name
 
+    def get_option(self, key: str, default: any = None) -> any:
+        """Reads an integration-specific setting from the table's config."""
+        config = self.raw_config if isinstance(self.raw_config, dict) else {}
+        return config.get(key, default)
+
     @classmethod
     def from_config(cls, table_config: Dict[str, any]) -> Self:
 
@@ -43,6 +56,8 @@ class Table:
             historical_frequency=table_config.get("historical_frequency"),
             file_format=table_config.get("file_format"),
             initial_timestamp=table_config.get("initial_timestamp"),
+            compression=table_config.get("compression"),
+            upload_concurrency=table_config.get("upload_concurrency"),
             raw_config=table_config,
         )
 
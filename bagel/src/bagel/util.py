@@ -1,15 +1,28 @@
 from datetime import datetime
+import gzip
+import io
+from itertools import compress, islice
 import json
+from typing import Generator, Iterable, Iterator, List, Optional
+import zlib
 
 import pandas as pd
 
+from .data import ColumnarData, is_arrow_table, is_stream
+
 
 def format_table_name(name: str) -> str:
     return name.lower().replace(" ", "_").replace("-", "_")
 
 
 def format_blob_name(
-    system, table, timestamp, log=False, file_format=None, file_name=None
+    system,
+    table,
+    timestamp,
+    log=False,
+    file_format=None,
+    file_name=None,
+    compression=None,
 ):
     if file_format is None:
         file_format = "log" if log else "json"
@@ -33,6 +46,9 @@ def format_blob_name(
         file_name = f"{system}/{file_type}/{table}/{year}/{month}/{day}/{_file_name}"
     else:
         file_name = f"{system}/{file_type}/{table}/{year}/{month}/{day}/{_file_name}.{file_format}"
+
+    if compression == "gzip":
+        file_name += ".gz"
     return file_name
 
 
@@ -45,6 +61,195 @@ def format_dict_to_json_binary(d):
     return bytes(json.dumps(d, default=str), "utf-8")
 
 
+def format_dict_to_jsonl_binary(d):
+    return bytes("".join(json.dumps(r, default=str) + "\n" for r in d), "utf-8")
+
+
+def format_dataframe_to_json_binary(df: pd.DataFrame, lines=False):
+    """Vectorized JSON writer: rows are encoded by pandas, never by per-row dicts.
+    Missing values (None, NaN, NaT) are written as null and datetimes as ISO 8601.
+    Floats keep 15 significant digits, the most pandas writes, so values that need
+    16-17 digits to round-trip (e.g. `0.1 + 0.2`) are rounded."""
+    if df.empty:
+        return b"" if lines else b"[]"
+
+    return bytes(
+        df.to_json(
+            orient="records",
+            lines=lines,
+            date_format="iso",
+            default_handler=str,
+            double_precision=15,
+        ),
+        "utf-8",
+    )
+
+
+def format_to_json_binary(data, lines=False):
+    if isinstance(data, ColumnarData):
+        data = data.to_dataframe()
+    elif is_arrow_table(data):
+        data = data.to_pandas()
+
+    if isinstance(data, pd.DataFrame):
+        return format_dataframe_to_json_binary(data, lines=lines)
+
+    if lines:
+        return format_dict_to_jsonl_binary(data)
+    return format_dict_to_json_binary(data)
+
+
+def format_to_parquet_binary(data):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if isinstance(data, ColumnarData):
+        table = data.to_arrow()
+    elif isinstance(data, pd.DataFrame):
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    elif is_arrow_table(data):
+        table = data
+    else:
+        table = pa.Table.from_pylist(data)
+
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+def format_bite_data(data, file_format=None):
+    """Serializes Bite data for the table's file format. Bytes, streams and
+    unknown formats (e.g. `document`) are passed through untouched."""
+    if is_stream(data):
+        if file_format in ["json", None, "jsonl", "parquet"]:
+            raise TypeError(f"Streamed Bites can't be written as {file_format}")
+        return data
+
+    if file_format in ["json", None]:
+        return format_to_json_binary(data)
+
+    if isinstance(data, bytes):
+        return data
+
+    if file_format == "jsonl":
+        return format_to_json_binary(data, lines=True)
+
+    if file_format == "parquet":
+        return format_to_parquet_binary(data)
+
+    return data
+
+
+def batched(iterable: Iterable, size: int) -> Generator[List, None, None]:
+    """Groups `iterable` into lists of at most `size` items."""
+    if size < 1:
+        raise ValueError("size must be at least 1")
+
+    items = iter(iterable)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def _gzip_stream(chunks: Iterator[bytes]) -> Generator[bytes, None, None]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def compress_data(data, compression=None):
+    if compression is None:
+        return data
+
+    if compression == "gzip":
+        if is_stream(data):
+            return _gzip_stream(data)
+        return gzip.compress(data, compresslevel=6)
+
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def serialize_bite_data(data, file_format=None, compression=None):
+    """Formats and compresses Bite data. Lives at module level so it can run in a
+    worker process."""
+    return compress_data(format_bite_data(data, file_format), compression)
+
+
+def _to_utc(timestamp) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def _get_field(row, keys):
+    for key in keys:
+        if not isinstance(row, dict):
+            return None
+        row = row.get(key)
+    return row
+
+
+def filter_by_timestamp(
+    data,
+    field: str,
+    last_run_timestamp: Optional[datetime] = None,
+    current_timestamp: Optional[datetime] = None,
+    timestamp_format: Optional[str] = None,
+):
+    """Keeps the rows whose `field` falls inside `[last_run_timestamp, current_timestamp)`.
+
+    All timestamps of the batch are parsed in one vectorized pass instead of one
+    `strptime` per row. `field` can be a dotted path into nested dicts (e.g.
+    `sys_updated_on.value`). Naive timestamps are treated as UTC, and rows without
+    a timestamp are dropped. Returns the same type it was given.
+
+    Args:
+        data (list | ColumnarData | pandas.DataFrame | pyarrow.Table)
+        field (str): column name or dotted path to the timestamp
+        last_run_timestamp (datetime): inclusive lower bound, `None` for no bound
+        current_timestamp (datetime): exclusive upper bound, `None` for no bound
+        timestamp_format (str): `strptime` format, inferred when `None`
+    """
+    if not len(data):
+        return data
+
+    column, *path = field.split(".")
+
+    if isinstance(data, ColumnarData):
+        values = data.column(column)
+    elif isinstance(data, pd.DataFrame):
+        values = data[column]
+    elif is_arrow_table(data):
+        values = data.column(column).to_pylist()
+    else:
+        values = [row.get(column) for row in data]
+
+    if path:
+        values = [_get_field(v, path) for v in values]
+
+    timestamps = pd.to_datetime(
+        pd.Series(values, dtype=object), format=timestamp_format, utc=True
+    )
+
+    mask = timestamps.notna()
+    if last_run_timestamp is not None:
+        mask &= timestamps >= _to_utc(last_run_timestamp)
+    if current_timestamp is not None:
+        mask &= timestamps < _to_utc(current_timestamp)
+    mask = mask.to_numpy()
+
+    if isinstance(data, ColumnarData):
+        return data.filter(mask)
+    if isinstance(data, pd.DataFrame):
+        return data[mask]
+    if is_arrow_table(data):
+        return data.filter(mask)
+    return list(compress(data, mask))
+
+
 def extract_date_ranges(
     last_run_timestamp, current_timestamp, historical_batch, historical_frequency
 ):
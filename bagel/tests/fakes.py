@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Iterator, Optional
 from src.bagel.base_clients import TimeboxClient, StorageClient
 
 
@@ -9,6 +9,7 @@ class MockTimeboxClient(TimeboxClient):
     ):
         self.lr_t = last_run_timestamp
         self.n_t = new_timestamp
+        self.state = {}
 
     def get_last_run_timestamp(
         self, system: str, table: str, initial_timestamp: Optional[datetime] = None
@@ -16,11 +17,57 @@ class MockTimeboxClient(TimeboxClient):
         return self.lr_t
 
     def write_run_timestamp(
-        self, system: str, table: str, timestamp: Optional[datetime] = None
+        self,
+        system: str,
+        table: str,
+        timestamp: Optional[datetime] = None,
+        state: Optional[dict] = None,
     ) -> any:
         self.lr_t = self.n_t
+        if state is not None:
+            self.state = dict(state)
         return f"Timestamp overwritten as {self.lr_t}"
 
+    def get_state(self, system: str, table: str) -> dict:
+        return dict(self.state)
+
+
+class RecordingTimeboxClient(MockTimeboxClient):
+    """Saves the timestamps it's given, like a real timebox."""
+
+    def __init__(self, last_run_timestamp: datetime, current_timestamp: datetime):
+        super().__init__(last_run_timestamp)
+        self.current_timestamp = current_timestamp
+
+    def get_current_timestamp(self) -> datetime:
+        return self.current_timestamp
+
+    def write_run_timestamp(
+        self,
+        system: str,
+        table: str,
+        timestamp: Optional[datetime] = None,
+        state: Optional[dict] = None,
+    ) -> any:
+        self.lr_t = timestamp
+        if state is not None:
+            self.state = dict(state)
+        return f"Timestamp overwritten as {self.lr_t}"
+
+
+class IndexedTimeboxClient(MockTimeboxClient):
+    def __init__(self, index: dict = None):
+        super().__init__()
+        self.index = dict(index or {})
+
+    def get_index(self, system: str, table: str) -> dict:
+        return dict(self.index)
+
+    def write_index_entry(
+        self, system: str, table: str, index_key: str, fingerprint: str
+    ):
+        self.index[index_key] = fingerprint
+
 
 class MockStorageClient(StorageClient):
     def upload_data(self, data: any, file_name: str):
@@ -30,6 +77,20 @@ class MockStorageClient(StorageClient):
         return f"Log {file_name} uploaded:\n{log}"
 
 
+class RecordingStorageClient(StorageClient):
+    def __init__(self):
+        self.uploads = []
+
+    def upload_data(self, file_name: str, data: any):
+        # read streams like a real upload would
+        if isinstance(data, Iterator):
+            data = b"".join(data)
+        self.uploads.append((file_name, data))
+
+    def upload_log(self, file_name: str, log: any):
+        pass
+
+
 class MockResponse:
     def __init__(self, **kwargs):
         self.json_data = kwargs.get("json_data")
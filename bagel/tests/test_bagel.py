@@ -1,5 +1,8 @@
 from datetime import datetime, timezone
+import gzip
+import json
 import os
+import time
 from typing import Generator
 
 import pytest
@@ -12,7 +15,14 @@ from src.bagel.data import Bite
 from src.bagel.errors import BagelError
 from src.bagel.table import Table
 
-from .fakes import MockStorageClient, MockTimeboxClient, MockDataDogResponse
+from .fakes import (
+    IndexedTimeboxClient,
+    MockStorageClient,
+    MockTimeboxClient,
+    MockDataDogResponse,
+    RecordingStorageClient,
+    RecordingTimeboxClient,
+)
 
 
 class TestBagel(unittest.TestCase):
@@ -174,6 +184,215 @@ class TestBagel(unittest.TestCase):
             == expected
         )
 
+    @pytest.mark.unit_test
+    def test_when_integration_updates_state_then_it_is_saved_and_resumed(self):
+        class TestIntegration(BagelIntegration):
+
+            source = "test_integration"
+            seen = []
+
+            def get_data(self, table, last_run_timestamp, current_timestamp):
+                self.seen.append(dict(table.state))
+                table.state["after"] = table.state.get("after", 0) + 1
+                yield Bite([{"foo": "bar"}])
+
+        integration = TestIntegration()
+        tb_c = MockTimeboxClient(datetime(2000, 1, 1), datetime(2000, 1, 2))
+        bagel = Bagel(integration, tb_c, MockStorageClient())
+
+        bagel._run_table(Table.from_config({"name": "test"}))
+        bagel._run_table(Table.from_config({"name": "test"}))
+
+        assert integration.seen == [{}, {"after": 1}]
+        assert tb_c.state == {"after": 2}
+
+    @pytest.mark.unit_test
+    def test_when_window_fails_after_checkpoint_then_next_run_resumes_it(self):
+        class TestIntegration(BagelIntegration):
+
+            source = "test_integration"
+            fail = True
+            calls = []
+
+            def get_data(self, table, last_run_timestamp, current_timestamp):
+                self.calls.append(
+                    (last_run_timestamp, current_timestamp, table.resume_state)
+                )
+                start = (table.resume_state or {}).get("page", 0)
+                for page in range(start, 3):
+                    if page == 2 and self.fail:
+                        raise RuntimeError("upstream down")
+                    yield Bite([{"page": page}], checkpoint={"page": page + 1})
+
+        integration = TestIntegration()
+        tb_c = RecordingTimeboxClient(datetime(2000, 1, 1), datetime(2000, 1, 2))
+        s_c = RecordingStorageClient()
+        bagel = Bagel(integration, tb_c, s_c)
+
+        with self.assertRaises(RuntimeError):
+            bagel._run_table(Table.from_config({"name": "test"}))
+
+        assert tb_c.state["checkpoint"] == {
+            "window_end": "2000-01-02T00:00:00",
+            "resume": {"page": 2},
+        }
+
+        assert tb_c.lr_t == datetime(2000, 1, 1)
+
+        integration.fail = False
+        tb_c.current_timestamp = datetime(2000, 1, 3)
+        bagel._run_table(Table.from_config({"name": "test"}))
+
+        assert integration.calls[1] == (
+            datetime(2000, 1, 1),
+            datetime(2000, 1, 2),
+            {"page": 2},
+        )
+        assert integration.calls[2] == (
+            datetime(2000, 1, 2),
+            datetime(2000, 1, 3),
+            None,
+        )
+        assert [json.loads(d)[0]["page"] for _, d in s_c.uploads] == [0, 1, 2, 0, 1, 2]
+        assert "checkpoint" not in tb_c.state
+        assert tb_c.lr_t == datetime(2000, 1, 3)
+
+    @pytest.mark.unit_test
+    def test_when_serializing_in_worker_processes_then_uploads_keep_bite_order(self):
+        class TestIntegration(BagelIntegration):
+
+            source = "test_integration"
+
+            def get_data(self, table, last_run_timestamp, current_timestamp):
+                for i in range(5):
+                    yield Bite([{"bite": i, "row": r} for r in range(i)])
+
+        s_c = RecordingStorageClient()
+        bagel = Bagel(
+            TestIntegration(),
+            timebox_client=MockTimeboxClient(
+                datetime(2000, 1, 1), datetime(2000, 1, 2)
+            ),
+            storage_client=s_c,
+            serialize_workers=2,
+            serialize_threshold=3,
+        )
+
+        with mock.patch("src.bagel.bagel.Bagel.get_table_list") as mock_tables:
+            mock_tables.return_value = [Table.from_config({"name": "test"})]
+            with mock.patch("src.bagel.bagel.Bagel._log_datadog_info"):
+                bagel.run()
+
+        result = [json.loads(data) for _, data in s_c.uploads]
+        expected = [[{"bite": i, "row": r} for r in range(i)] for i in range(5)]
+        assert result == expected
+        assert bagel._serialize_pool is None
+
+    @pytest.mark.unit_test
+    @mock.patch("src.bagel.bagel.Bagel.get_table_list")
+    @mock.patch("src.bagel.bagel.Bagel._run_table")
+    def test_when_run_ends_then_integration_cache_is_cleared(
+        self, mock__run_table, mock_get_table_list
+    ):
+        mock_get_table_list.return_value = []
+        self.test_integration.cache.get_or_compute("users", lambda: ["foo"])
+
+        self.plain_bagel.run()
+
+        assert len(self.test_integration.cache) == 0
+
+    @pytest.mark.unit_test
+    @mock.patch("src.bagel.bagel.Bagel.get_table_list")
+    @mock.patch("src.bagel.bagel.Bagel._run_table")
+    @mock.patch("src.bagel.bagel.Bagel._log_datadog_error")
+    def test_when_run_ends_then_integration_is_closed(
+        self, mock_log_datadog_error, mock__run_table, mock_get_table_list
+    ):
+        mock_get_table_list.return_value = [Table("foo")]
+        mock__run_table.side_effect = Exception("failed table")
+
+        with mock.patch.object(self.test_integration, "close") as mock_close:
+            with self.assertRaises(BagelError):
+                self.plain_bagel.run()
+
+        mock_close.assert_called_once()
+
+    @pytest.mark.unit_test
+    def test_when_table_is_gzip_compressed_then_blob_is_gzipped(self):
+        s_c = RecordingStorageClient()
+        bagel = Bagel(
+            self.test_integration,
+            timebox_client=MockTimeboxClient(
+                datetime(2000, 1, 1), datetime(2000, 1, 2)
+            ),
+            storage_client=s_c,
+        )
+
+        bagel._run_table(Table.from_config({"name": "test", "compression": "gzip"}))
+
+        file_name, data = s_c.uploads[0]
+        assert file_name.endswith(".json.gz")
+        assert json.loads(gzip.decompress(data)) == [{"foo": "bar"}]
+
+    @pytest.mark.unit_test
+    def test_when_uploading_concurrently_then_data_log_keeps_bite_order(self):
+        s_c = RecordingStorageClient()
+        bagel = Bagel(self.test_integration, MockTimeboxClient(), s_c)
+
+        def slow_upload(file_name, data):
+            time.sleep(0.01 * (5 - len(data)))
+            s_c.uploads.append((file_name, data))
+
+        s_c.upload_data = slow_upload
+        bites = (Bite(b"x" * i, file_name=f"{i}.bin") for i in range(5))
+        table = Table.from_config(
+            {"name": "test", "file_format": "document", "upload_concurrency": 3}
+        )
+
+        result = bagel._upload_bites(table, bites)
+
+        assert [r.rsplit("-", 1)[-1] for r in result] == [f"{i}.bin" for i in range(5)]
+        assert sorted(data for _, data in s_c.uploads) == [b"x" * i for i in range(5)]
+
+    @pytest.mark.unit_test
+    def test_when_bite_is_a_stream_then_chunks_are_uploaded(self):
+        s_c = RecordingStorageClient()
+        bagel = Bagel(self.test_integration, MockTimeboxClient(), s_c)
+        table = Table.from_config(
+            {"name": "test", "file_format": "document", "compression": "gzip"}
+        )
+
+        bagel._upload_bites(table, [Bite(iter([b"foo", b"bar"]), file_name="a.pdf")])
+
+        file_name, data = s_c.uploads[0]
+        assert file_name.endswith("a.pdf.gz")
+        assert gzip.decompress(data) == b"foobar"
+
+    @pytest.mark.unit_test
+    def test_when_bite_is_in_index_then_skip_without_reading_it(self):
+        s_c = RecordingStorageClient()
+        tb_c = IndexedTimeboxClient({"a": "1", "b": "1"})
+        bagel = Bagel(self.test_integration, tb_c, s_c)
+        read = []
+
+        def stream(name):
+            read.append(name)
+            yield name.encode("utf-8")
+
+        bites = [
+            Bite(stream("a"), file_name="a", index_key="a", fingerprint="1"),
+            Bite(stream("b"), file_name="b", index_key="b", fingerprint="2"),
+            Bite(stream("c"), file_name="c", index_key="c", fingerprint="1"),
+            Bite(stream("d"), file_name="d"),
+        ]
+        table = Table.from_config({"name": "test", "file_format": "document"})
+
+        result = bagel._upload_bites(table, bites)
+
+        assert len(result) == 3
+        assert read == ["b", "c", "d"]
+        assert tb_c.index == {"a": "1", "b": "2", "c": "1"}
+
     # @pytest.mark.unit_test
     # @mock.patch("src.bagel.bagel.Bagel.get_table_list")
     # @mock.patch("src.bagel.bagel.Bagel._run_table")
@@ -1,8 +1,10 @@
+import pandas as pd
+import pyarrow as pa
 import pytest
 import unittest
 from unittest import mock
 
-from src.bagel.data import Bite
+from src.bagel.data import Bite, ColumnarData
 
 
 class TestBite(unittest.TestCase):
@@ -33,6 +35,58 @@ class TestBite(unittest.TestCase):
         with self.assertRaises(TypeError):
             Bite(42)
 
+    @pytest.mark.unit_test
+    def test_when_data_is_columnar_then_dont_raise(self):
+
+        Bite(ColumnarData.from_rows(["a", "b"], [[1, 2], [3, 4]]))
+
+    @pytest.mark.unit_test
+    def test_when_data_is_dataframe_then_dont_raise(self):
+
+        Bite(pd.DataFrame({"a": [1, 2]}))
+
+    @pytest.mark.unit_test
+    def test_when_data_is_arrow_table_then_dont_raise(self):
+
+        Bite(pa.table({"a": [1, 2]}))
+
+    @pytest.mark.unit_test
+    def test_when_dataframe_or_arrow_bites_compared_then_return_bool(self):
+
+        rows = [{"foo": "bar", "n": 1}]
+
+        for make in [pd.DataFrame, pa.Table.from_pylist]:
+            assert Bite(make(rows)) == Bite(make(rows))
+            assert Bite(make(rows)) != Bite(make([{"foo": "baz", "n": 1}]))
+            assert Bite(make(rows)) != Bite(make(rows), file_name="foo")
+            assert Bite(make(rows)) != Bite(rows)
+            assert Bite(rows) != Bite(make(rows))
+
+    @pytest.mark.unit_test
+    def test_when_columnar_built_from_rows_then_arrays_are_columns(self):
+
+        result = ColumnarData.from_rows(["a", "b"], [[1, 2], [3, 4]])
+
+        assert result.column("a") == (1, 3)
+        assert result.column("b") == (2, 4)
+        assert len(result) == 2
+        assert list(result.records()) == [{"a": 1, "b": 2}, {"a": 3, "b": 4}]
+
+    @pytest.mark.unit_test
+    def test_when_columnar_filtered_and_selected_then_rows_are_kept_in_order(self):
+
+        data = ColumnarData.from_arrays(["a", "b"], [[1, 2, 3], ["x", "y", "z"]])
+
+        result = data.filter([True, False, True]).select("b")
+
+        assert result == ColumnarData.from_arrays(["b"], [["x", "z"]])
+
+    @pytest.mark.unit_test
+    def test_when_columnar_arrays_have_different_lengths_then_raise(self):
+
+        with self.assertRaises(ValueError):
+            ColumnarData.from_arrays(["a", "b"], [[1, 2], [3]])
+
     @pytest.mark.unit_test
     @mock.patch("src.bagel.bagel.format_blob_name")
     @mock.patch("src.bagel.bagel.os.getenv")
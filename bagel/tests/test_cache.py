@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+import pytest
+import unittest
+
+from src.bagel.cache import RunCache
+
+
+class TestRunCache(unittest.TestCase):
+    @pytest.mark.unit_test
+    def test_when_key_is_cached_then_func_is_called_once(self):
+        calls = []
+        cache = RunCache()
+
+        def fetch(x):
+            calls.append(x)
+            return [x]
+
+        first = cache.get_or_compute("users", fetch, 1)
+        second = cache.get_or_compute("users", fetch, 2)
+
+        assert first == second == [1]
+        assert calls == [1]
+
+    @pytest.mark.unit_test
+    def test_when_over_max_items_then_oldest_spill_to_disk_and_load_back(self):
+        cache = RunCache(max_items=1)
+
+        cache.get_or_compute("a", lambda: {"a": 1})
+        cache.get_or_compute("b", lambda: {"b": 2})
+
+        assert list(cache._memory) == ["b"]
+        assert os.path.exists(cache._spilled["a"])
+        assert list(cache._key_locks) == ["b"]
+        assert cache.get_or_compute("a", lambda: None) == {"a": 1}
+        assert list(cache._memory) == ["a"]
+        assert len(cache) == 2
+
+    @pytest.mark.unit_test
+    def test_when_cleared_then_spilled_files_are_removed(self):
+        cache = RunCache(max_items=1)
+        cache.get_or_compute("a", lambda: 1)
+        cache.get_or_compute("b", lambda: 2)
+        tmp_dir = cache._tmp_dir
+
+        cache.clear()
+
+        assert len(cache) == 0
+        assert not os.path.exists(tmp_dir)
+        assert cache.get_or_compute("a", lambda: 3) == 3
+
+    @pytest.mark.unit_test
+    def test_when_called_concurrently_then_key_is_computed_once(self):
+        calls = []
+        cache = RunCache()
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return "users"
+
+        threads = [
+            threading.Thread(target=cache.get_or_compute, args=("users", fetch))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert calls == [1]
+
+    @pytest.mark.unit_test
+    def test_when_func_raises_then_nothing_is_cached(self):
+        cache = RunCache()
+
+        def fail():
+            raise RuntimeError("upstream down")
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_compute("users", fail)
+
+        assert "users" not in cache
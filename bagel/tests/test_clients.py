@@ -219,6 +219,91 @@ class TestAzureTableClient(unittest.TestCase):
 
         t_c.close()
 
+    @pytest.mark.unit_test
+    @mock.patch("src.bagel.clients.os.getenv")
+    @mock.patch("src.bagel.clients.AzureNamedKeyCredential")
+    @mock.patch("src.bagel.clients.TableServiceClient")
+    def test_when_writing_timestamp_with_state_then_state_is_read_back(
+        self, mock_TableServiceClient, mock_AzureNamedKeyCredential, mock_getenv
+    ):
+        class MockTableClient:
+            def __init__(self):
+                self.entity = None
+
+            def get_entity(self, **kwargs):
+                if self.entity is None:
+                    raise ResourceNotFoundError()
+                return self.entity
+
+            def upsert_entity(self, mode, entity):
+                self.entity = {**(self.entity or {}), **entity}
+
+        class MockTableServiceClient:
+            def get_table_client(self, table):
+                return MockTableClient()
+
+        mock_getenv.return_value = "asdf"
+        mock_TableServiceClient.return_value = MockTableServiceClient()
+
+        t_c = AzureTableClient()
+        t_c.connect()
+
+        assert t_c.get_state("foo", "bar") == {}
+
+        state = {"after": "abc", "page": 3}
+        entity = t_c.write_run_timestamp(
+            "foo", "bar", datetime(2000, 1, 1), state=state
+        )
+        t_c.write_run_timestamp("foo", "bar", datetime(2000, 1, 2))
+
+        assert entity["last_updated_timestamp"] == "2000-01-01T00:00:00.000000Z"
+        assert t_c.get_state("foo", "bar") == state
+
+        t_c._entities.clear()
+        assert t_c.get_state("foo", "bar") == state
+
+        with self.assertRaises(ValueError):
+            t_c.write_run_timestamp(
+                "foo", "bar", datetime(2000, 1, 3), state={"x": "a" * 40_000}
+            )
+
+    @pytest.mark.unit_test
+    @mock.patch("src.bagel.clients.os.getenv")
+    @mock.patch("src.bagel.clients.AzureNamedKeyCredential")
+    @mock.patch("src.bagel.clients.TableServiceClient")
+    def test_when_writing_index_entry_then_it_is_read_back_in_index(
+        self, mock_TableServiceClient, mock_AzureNamedKeyCredential, mock_getenv
+    ):
+        class MockTableClient:
+            def __init__(self):
+                self.entities = {}
+
+            def upsert_entity(self, mode, entity):
+                self.entities[(entity["PartitionKey"], entity["RowKey"])] = entity
+
+            def query_entities(self, query_filter, parameters, select):
+                return [
+                    e
+                    for (pk, _), e in self.entities.items()
+                    if pk == parameters["partition_key"]
+                ]
+
+        class MockTableServiceClient:
+            def get_table_client(self, table):
+                return MockTableClient()
+
+        mock_getenv.return_value = "asdf"
+        mock_TableServiceClient.return_value = MockTableServiceClient()
+
+        t_c = AzureTableClient()
+        t_c.connect()
+
+        entity = t_c.write_index_entry("foo", "bar", "1|/a/b|c.pdf", "3|yesterday")
+        t_c.write_index_entry("foo", "baz", "1|/a/b|c.pdf", "4|today")
+
+        assert "/" not in entity["RowKey"]
+        assert t_c.get_index("foo", "bar") == {"1|/a/b|c.pdf": "3|yesterday"}
+
 
 class TestAzureBlobClient(unittest.TestCase):
     @pytest.mark.unit_test
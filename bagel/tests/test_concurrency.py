@@ -0,0 +1,76 @@
+from itertools import count
+import threading
+import time
+
+import pytest
+import unittest
+
+from src.bagel.concurrency import RateLimiter, bounded_map
+
+
+class TestBoundedMap(unittest.TestCase):
+    @pytest.mark.unit_test
+    def test_when_ordered_then_results_keep_input_order(self):
+        def slow_square(i):
+            time.sleep(0.01 * (5 - i))
+            return i * i
+
+        result = list(bounded_map(slow_square, range(5), max_workers=3))
+
+        assert result == [0, 1, 4, 9, 16]
+
+    @pytest.mark.unit_test
+    def test_when_unordered_then_all_results_are_yielded(self):
+
+        result = bounded_map(lambda i: i, range(10), max_workers=3, ordered=False)
+
+        assert sorted(result) == list(range(10))
+
+    @pytest.mark.unit_test
+    def test_when_iterable_is_infinite_then_in_flight_calls_are_bounded(self):
+        lock = threading.Lock()
+        started = []
+
+        def record(i):
+            with lock:
+                started.append(i)
+            return i
+
+        results = bounded_map(record, count(), max_workers=2)
+        first = [next(results) for _ in range(3)]
+        results.close()
+
+        assert first == [0, 1, 2]
+        assert len(started) <= 5
+
+    @pytest.mark.unit_test
+    def test_when_call_raises_then_error_is_raised_to_caller(self):
+        def fail(i):
+            raise RuntimeError(i)
+
+        with self.assertRaises(RuntimeError):
+            list(bounded_map(fail, range(3)))
+
+
+class TestRateLimiter(unittest.TestCase):
+    @pytest.mark.unit_test
+    def test_when_quota_is_used_then_next_call_waits_for_window(self):
+        limiter = RateLimiter(max_calls=2, period=0.1)
+
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        elapsed = time.monotonic() - start
+
+        assert elapsed >= 0.1
+
+    @pytest.mark.unit_test
+    def test_when_under_quota_then_calls_do_not_wait(self):
+        limiter = RateLimiter(max_calls=5, period=10)
+
+        start = time.monotonic()
+        for _ in range(5):
+            with limiter:
+                pass
+
+        assert time.monotonic() - start < 1
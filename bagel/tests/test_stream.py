@@ -0,0 +1,54 @@
+import io
+import json
+
+import pytest
+import unittest
+
+from src.bagel.data import Bite
+from src.bagel.stream import format_json_path, stream_json_bites
+
+
+class TestStream(unittest.TestCase):
+    @pytest.mark.unit_test
+    def test_when_formatting_json_path_then_wildcards_and_indexes_become_items(self):
+
+        assert format_json_path("result.*") == "result.item"
+        assert format_json_path("0.Rows.*") == "item.Rows.item"
+        assert format_json_path("*") == "item"
+
+    @pytest.mark.unit_test
+    def test_when_streaming_array_then_rows_are_batched(self):
+
+        rows = [{"id": i} for i in range(5)]
+        source = json.dumps({"count": 5, "result": rows}).encode("utf-8")
+
+        result = list(stream_json_bites(source, "result.*", batch_size=2))
+
+        expected = [
+            Bite([{"id": 0}, {"id": 1}]),
+            Bite([{"id": 2}, {"id": 3}]),
+            Bite([{"id": 4}]),
+        ]
+        assert result == expected
+
+    @pytest.mark.unit_test
+    def test_when_streaming_file_like_then_floats_are_not_decimals(self):
+
+        source = io.BytesIO(b'{"vulnerabilities": [{"score": 9.8}]}')
+
+        result = next(stream_json_bites(source, "vulnerabilities.*"))
+
+        assert isinstance(result.data[0]["score"], float)
+
+    @pytest.mark.unit_test
+    def test_when_path_has_no_rows_then_yield_nothing(self):
+
+        result = list(stream_json_bites(b'{"result": []}', "result.*"))
+
+        assert result == []
+
+    @pytest.mark.unit_test
+    def test_when_source_is_not_readable_then_raise(self):
+
+        with self.assertRaises(TypeError):
+            next(stream_json_bites(42, "result.*"))
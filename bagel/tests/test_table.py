@@ -24,3 +24,12 @@ class TestTable(unittest.TestCase):
         expected = "table_asdf_foo"
         result = t.name
         assert result == expected
+
+    @pytest.mark.unit_test
+    def test_when_option_in_config_then_get_option_returns_it(self):
+
+        t = Table.from_config({"name": "foo", "page_size": 10})
+
+        assert t.get_option("page_size") == 10
+        assert t.get_option("missing", 5) == 5
+        assert Table("foo").get_option("page_size") is None
@@ -1,13 +1,22 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import gzip
 import json
 
+import pandas as pd
+import pyarrow as pa
 import pytest
 import unittest
 
+from src.bagel.data import ColumnarData
 from src.bagel.util import (
+    batched,
+    compress_data,
+    format_bite_data,
+    filter_by_timestamp,
     format_blob_name,
     format_table_name,
     format_dict_to_json_binary,
+    format_dict_to_jsonl_binary,
     extract_date_ranges,
     get_historical_batch_ranges,
 )
@@ -194,3 +203,177 @@ class TestUtil(unittest.TestCase):
         assert date_ranges[0] == start_time
         assert date_ranges[-1] == end_time
         assert date_ranges[1] == start_time + delta
+
+    @pytest.mark.unit_test
+    def test_when_columnar_data_formatted_as_json_then_it_matches_records(self):
+
+        data = ColumnarData.from_rows(["foo", "n"], [["bar", 1], ["baz", None]])
+
+        result = format_bite_data(data, "json")
+
+        assert json.loads(result) == [{"foo": "bar", "n": 1}, {"foo": "baz", "n": None}]
+
+    @pytest.mark.unit_test
+    def test_when_empty_columnar_data_formatted_as_json_then_empty_array(self):
+
+        result = format_bite_data(ColumnarData.from_rows([], []))
+
+        assert result == b"[]"
+
+    @pytest.mark.unit_test
+    def test_when_data_formatted_as_jsonl_then_one_record_per_line(self):
+
+        input_ = [{"foo": "bar"}, {"foo": "baz"}]
+        columnar = ColumnarData.from_rows(["foo"], [["bar"], ["baz"]])
+
+        for data in [input_, columnar]:
+            lines = format_bite_data(data, "jsonl").decode("utf-8").splitlines()
+            assert [json.loads(line) for line in lines] == input_
+
+    @pytest.mark.unit_test
+    def test_when_data_formatted_as_parquet_then_it_round_trips(self):
+        import io
+
+        import pyarrow.parquet as pq
+
+        input_ = [{"foo": "bar", "n": 1}, {"foo": "baz", "n": 2}]
+        columnar = ColumnarData.from_rows(["foo", "n"], [["bar", 1], ["baz", 2]])
+
+        for data in [input_, columnar]:
+            result = pq.read_table(io.BytesIO(format_bite_data(data, "parquet")))
+            assert result.to_pylist() == input_
+
+    @pytest.mark.unit_test
+    def test_when_data_is_bytes_and_format_is_not_json_then_pass_through(self):
+
+        assert format_bite_data(b"foo", "document") == b"foo"
+        assert format_bite_data(b"foo", "parquet") == b"foo"
+
+    @pytest.mark.unit_test
+    def test_when_dataframe_or_arrow_formatted_then_records_are_written(self):
+        import io
+
+        import pyarrow.parquet as pq
+
+        input_ = [{"foo": "bar", "n": 1}, {"foo": "baz", "n": 2}]
+
+        for data in [pd.DataFrame(input_), pa.Table.from_pylist(input_)]:
+            assert json.loads(format_bite_data(data, "json")) == input_
+
+            lines = format_bite_data(data, "jsonl").decode("utf-8").splitlines()
+            assert [json.loads(line) for line in lines] == input_
+
+            result = pq.read_table(io.BytesIO(format_bite_data(data, "parquet")))
+            assert result.to_pylist() == input_
+
+    @pytest.mark.unit_test
+    def test_when_columnar_data_formatted_as_json_then_it_parses_like_records(self):
+
+        input_ = [
+            {"n": 0.25, "url": "a/b", "id": 1},
+            {"n": 1234.5678, "url": None, "id": 2},
+            {"n": None, "url": "é", "id": None},
+        ]
+        columnar = ColumnarData.from_rows(
+            ["n", "url", "id"], [list(r.values()) for r in input_]
+        )
+
+        result = format_bite_data(columnar, "json")
+        assert json.loads(result) == json.loads(format_dict_to_json_binary(input_))
+
+        result = format_bite_data(columnar, "jsonl")
+        expected = format_dict_to_jsonl_binary(input_)
+        assert [json.loads(line) for line in result.splitlines()] == [
+            json.loads(line) for line in expected.splitlines()
+        ]
+
+    @pytest.mark.unit_test
+    def test_when_dataframe_has_missing_values_then_they_are_written_as_null(self):
+
+        ts = pd.Timestamp("2024-01-01 05:00:00")
+        df = pd.DataFrame({"a": [1.5, None], "b": ["x", None], "t": [ts, None]})
+        expected = [
+            {"a": 1.5, "b": "x", "t": "2024-01-01T05:00:00.000"},
+            {"a": None, "b": None, "t": None},
+        ]
+
+        for data in [df, pa.Table.from_pandas(df)]:
+            # json.loads would accept NaN, so check the text as well
+            result = format_bite_data(data, "json")
+            assert b"NaN" not in result and b"NaT" not in result
+            assert json.loads(result) == expected
+
+            lines = format_bite_data(data, "jsonl").splitlines()
+            assert [json.loads(line) for line in lines] == expected
+
+    @pytest.mark.unit_test
+    def test_when_filtering_by_timestamp_then_window_is_half_open(self):
+
+        rows = [
+            {"sys_updated_on": {"value": f"2022-01-0{day} 00:00:00"}}
+            for day in range(1, 6)
+        ]
+
+        result = filter_by_timestamp(
+            rows,
+            "sys_updated_on.value",
+            datetime(2022, 1, 2),
+            datetime(2022, 1, 4),
+            "%Y-%m-%d %H:%M:%S",
+        )
+
+        assert result == rows[1:3]
+
+    @pytest.mark.unit_test
+    def test_when_filtering_columnar_data_by_timestamp_then_same_type_returned(self):
+
+        data = ColumnarData.from_rows(
+            ["id", "modified"],
+            [["a", "2022-01-01 00:00:00.000"], ["b", "2022-01-03 00:00:00.000"]],
+        )
+
+        result = filter_by_timestamp(
+            data, "modified", datetime(2022, 1, 2), None, "%Y-%m-%d %H:%M:%S.%f"
+        )
+
+        assert result == ColumnarData.from_rows(
+            ["id", "modified"], [["b", "2022-01-03 00:00:00.000"]]
+        )
+
+    @pytest.mark.unit_test
+    def test_when_filtering_aware_timestamps_with_naive_bounds_then_treat_as_utc(
+        self,
+    ):
+
+        rows = [
+            {"updated_at": datetime(2022, 1, 1, tzinfo=timezone.utc)},
+            {"updated_at": datetime(2022, 1, 3, tzinfo=timezone.utc)},
+            {"updated_at": None},
+        ]
+
+        result = filter_by_timestamp(rows, "updated_at", datetime(2022, 1, 2))
+
+        assert result == rows[1:2]
+
+    @pytest.mark.unit_test
+    def test_when_batching_then_last_batch_holds_the_remainder(self):
+
+        result = list(batched(range(5), 2))
+
+        assert result == [[0, 1], [2, 3], [4]]
+
+    @pytest.mark.unit_test
+    def test_when_compressing_stream_then_chunks_are_gzipped_lazily(self):
+
+        result = compress_data(iter([b"foo", b"bar"]), "gzip")
+
+        assert not isinstance(result, bytes)
+        assert gzip.decompress(b"".join(result)) == b"foobar"
+
+    @pytest.mark.unit_test
+    def test_when_stream_is_formatted_as_json_then_raise(self):
+
+        with self.assertRaises(TypeError):
+            format_bite_data(iter([b"foo"]), "json")
+
+        assert list(format_bite_data(iter([b"foo"]), "document")) == [b"foo"]
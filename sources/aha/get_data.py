@@ -1,3 +1,4 @@
+from functools import partial
 import os
 import requests
 import logging
@@ -5,6 +6,7 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 from bagel import Bagel, BagelIntegration, Bite, Table
+from bagel.concurrency import RateLimiter, bounded_map
 
 
 logging.basicConfig(
@@ -16,6 +18,8 @@ logging.basicConfig(
 class Aha(BagelIntegration):
 
     source = "aha"
+    # ideas fetched at once; tables.yaml `concurrency` overrides it
+    concurrency = 8
 
     ##############
     # Initialize #
@@ -23,13 +27,31 @@ class Aha(BagelIntegration):
 
     def __post_init__(self) -> None:
         self.base_url = "https://trimedx-solutions.aha.io/api/v1/"
+        self.session = self.aha_get_session()
+        # Aha allows 20 requests per second and 300 per minute
+        self.rate_limiters = [RateLimiter(20, 1), RateLimiter(300, 60)]
+
+    def aha_get_session(self):
+        # set up request features to try again in case of ConnectionError, with a
+        # connection per concurrent idea
+        session = requests.Session()
+        retry = Retry(connect=3, backoff_factor=0.5)
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=self.concurrency)
+        session.mount("https://", adapter)
+        return session
 
     ###########################
     # Get URL (Updated_Since) #
     ###########################
 
     def aha_get_url(
-        self, table, last_run_timestamp, idea_id=1, page=1, idea_list=False
+        self,
+        table,
+        last_run_timestamp,
+        idea_id=1,
+        page=1,
+        idea_list=False,
+        fields=None,
     ):
         IDEAS = "ideas"
         last_run_timestamp = last_run_timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fz")
@@ -46,6 +68,10 @@ class Aha(BagelIntegration):
                 f"{self.base_url}{table}/{idea_id}?{updated_since}&{per_page}&{paging}"
             )
 
+        # only return these fields, e.g. the full idea from the list endpoint
+        if fields:
+            table_url += f"&fields={','.join(fields)}"
+
         return table_url
 
     ##############
@@ -68,13 +94,11 @@ class Aha(BagelIntegration):
 
     def aha_api_call(self, table, url, header, idea_list=False):
 
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("https://", adapter)
+        for rate_limiter in self.rate_limiters:
+            rate_limiter.acquire()
 
         # get the data for this page and add it to the final list
-        response = session.get(url, headers=header)
+        response = self.session.get(url, headers=header)
 
         if response.status_code != 200:
             raise RuntimeError(
@@ -92,35 +116,25 @@ class Aha(BagelIntegration):
 
         return data_list, total_pages
 
-    ########
-    # MAIN #
-    ########
-
-    def get_data(self, table: Table, last_run_timestamp, current_timestamp):
+    ################
+    # Get Idea Ids #
+    ################
 
-        # initialize variables
-        ZERO = 0
+    def aha_get_idea_ids(self, table_name, last_run_timestamp):
         idea_ids = []
         current_page = 1
-        self.header = self.aha_get_header()
-
-        #
-        # first we want to get a list of ideas to get votes for
-        #
 
         # get first URL
-        table_name = table.name
-        self.next_url = self.aha_get_url(
+        next_url = self.aha_get_url(
             table_name, last_run_timestamp, page=current_page, idea_list=True
         )
 
         # while there is another page
-        while self.next_url:
+        while next_url:
 
             # set total pages expected
-            # start building idea_ids to pass to "endorsements"
             data, total_pages = self.aha_api_call(
-                table_name, self.next_url, self.header, idea_list=True
+                table_name, next_url, self.header, idea_list=True
             )
 
             # add idea ids to list if applicable
@@ -131,57 +145,158 @@ class Aha(BagelIntegration):
             # if this isn't the final page, get the URL set for the next page and repeat the while loop
             if current_page < total_pages:
                 current_page += 1
-                self.next_url = self.aha_get_url(
+                next_url = self.aha_get_url(
                     table_name,
                     last_run_timestamp,
                     page=current_page,
                     idea_list=True,
                 )
             else:
-                self.next_url = None
+                next_url = None
+
+        return idea_ids
+
+    ########
+    # MAIN #
+    ########
+
+    def get_data(self, table: Table, last_run_timestamp, current_timestamp):
+
+        # initialize variables
+        self.header = self.aha_get_header()
+
+        # with `fields` set, full ideas come from the list endpoint a page at a time
+        if table.name == "ideas" and self.aha_get_fields(table, "fields"):
+            yield from self.aha_get_idea_list(table, last_run_timestamp)
+            return None
+
+        #
+        # first we want to get a list of ideas to get votes for
+        #
+
+        table_name = table.name
+        idea_ids = self.aha_get_idea_ids(table_name, last_run_timestamp)
 
         #
         # now that we have a list of ideas, get the data for each of them
         #
 
-        # pseudo do-while loop
-        while len(idea_ids) != 0:
+        # ideas are fetched concurrently and yielded as they complete
+        concurrency = table.get_option("concurrency", self.concurrency)
+        get_idea_pages = partial(
+            self.aha_get_idea_pages, table_name, last_run_timestamp
+        )
+
+        for pages in bounded_map(get_idea_pages, idea_ids, concurrency, ordered=False):
+            for data in pages:
+                yield Bite(data)
+
+        return None
+
+    #################
+    # Get Idea List #
+    #################
+
+    def aha_get_fields(self, table: Table, key):
+        """`fields`/`detail_fields` from tables.yaml, as a list or a comma separated string."""
+        fields = table.get_option(key) or []
+        if isinstance(fields, str):
+            fields = fields.split(",")
+        return [f.strip() for f in fields if f.strip()]
+
+    def aha_get_idea_list(self, table: Table, last_run_timestamp):
+        """Yields a Bite per page of 200 ideas, shaped like the `ideas/{id}` response.
+        Only `detail_fields`, which the list endpoint can't return, are fetched per idea."""
+        table_name = table.name
+        fields = self.aha_get_fields(table, "fields")
+        detail_fields = self.aha_get_fields(table, "detail_fields")
+        # detail calls need the idea id
+        if detail_fields and "id" not in fields:
+            fields.append("id")
+        concurrency = table.get_option("concurrency", self.concurrency)
+        current_page = 1
 
-            # reset the current_page variable
-            current_page = 1
+        next_url = self.aha_get_url(
+            table_name,
+            last_run_timestamp,
+            page=current_page,
+            idea_list=True,
+            fields=fields,
+        )
 
-            # get first URL
-            self.next_url = self.aha_get_url(
-                table_name, last_run_timestamp, idea_ids[ZERO], current_page
+        while next_url:
+            data, total_pages = self.aha_api_call(
+                table_name, next_url, self.header, idea_list=True
             )
+            ideas = data[0]["ideas"]
+
+            if detail_fields:
+                get_details = partial(
+                    self.aha_get_idea_details,
+                    table_name,
+                    last_run_timestamp,
+                    detail_fields,
+                )
+                for idea, details in zip(
+                    ideas, bounded_map(get_details, ideas, concurrency)
+                ):
+                    idea.update(details)
 
-            # while there is another page
-            while self.next_url:
+            if ideas:
+                yield Bite([{"idea": idea} for idea in ideas])
 
-                # return data to azure
-                # set total pages expected for table
-                data, total_pages = self.aha_api_call(
-                    table_name, self.next_url, self.header
+            if current_page < total_pages:
+                current_page += 1
+                next_url = self.aha_get_url(
+                    table_name,
+                    last_run_timestamp,
+                    page=current_page,
+                    idea_list=True,
+                    fields=fields,
                 )
-                yield Bite(data)
+            else:
+                next_url = None
 
-                # if this isn't the final page, get the URL set for the next page and repeat the while loop
-                if current_page < total_pages:
-                    current_page += 1
-                    self.next_url = self.aha_get_url(
-                        table_name,
-                        last_run_timestamp,
-                        idea_ids[ZERO],
-                        current_page,
-                    )
-                else:
-                    self.next_url = None
-
-            # once all the pages for the idea_id have been processed, pop the idea_id we just used so we can use the next one in line
-            # the loop will stop once there are no more values in idea_ids[]
-            idea_ids.pop(ZERO)
+    def aha_get_idea_details(self, table_name, last_run_timestamp, fields, idea):
+        url = self.aha_get_url(
+            table_name, last_run_timestamp, idea["id"], fields=fields
+        )
+        data, _ = self.aha_api_call(table_name, url, self.header)
+        return data[0]["idea"]
 
-        return None
+    ##################
+    # Get Idea Pages #
+    ##################
+
+    def aha_get_idea_pages(self, table_name, last_run_timestamp, idea_id):
+        pages = []
+        current_page = 1
+
+        # get first URL
+        next_url = self.aha_get_url(
+            table_name, last_run_timestamp, idea_id, current_page
+        )
+
+        # while there is another page
+        while next_url:
+
+            # set total pages expected for table
+            data, total_pages = self.aha_api_call(table_name, next_url, self.header)
+            pages.append(data)
+
+            # if this isn't the final page, get the URL set for the next page and repeat the while loop
+            if current_page < total_pages:
+                current_page += 1
+                next_url = self.aha_get_url(
+                    table_name,
+                    last_run_timestamp,
+                    idea_id,
+                    current_page,
+                )
+            else:
+                next_url = None
+
+        return pages
 
 
 ######################
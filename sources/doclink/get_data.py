@@ -1,11 +1,14 @@
+from functools import partial
 import os
+import threading
 import requests
 import logging
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from bagel import Bagel, BagelIntegration, Bite, Table
+from bagel import Bagel, BagelIntegration, Bite, ColumnarData, Table
+from bagel.concurrency import bounded_map
 
 
 logging.basicConfig(
@@ -16,6 +19,11 @@ logging.basicConfig(
 
 class DocLink(BagelIntegration):
     source = "doclink"
+    # procedure calls at once; tables.yaml `concurrency` overrides it
+    concurrency = 8
+    # consecutive days are combined into one Bite up to this many rows;
+    # tables.yaml `target_rows` overrides it
+    target_rows = 50000
 
     ##############
     # Initialize #
@@ -23,6 +31,10 @@ class DocLink(BagelIntegration):
 
     def __post_init__(self) -> None:
         self._load_config()
+        self.session = self.doclink_get_session()
+        # one AuthCode for the whole run, see `doclink_get_authcode`
+        self._doclink_authcode = None
+        self._auth_lock = threading.Lock()
 
     def _load_config(self):
         self.doclink_username = os.environ["DOCLINK_USERNAME"]
@@ -30,6 +42,15 @@ class DocLink(BagelIntegration):
         self._doclink_site_code = os.environ["DOCLINK_SITE_CODE"]
         self.doclink_base_url = os.environ["DOCLINK_BASE_URL"]
 
+    def doclink_get_session(self):
+        # set up request features to try again in case of ConnectionError, with a
+        # connection per concurrent procedure call
+        session = requests.Session()
+        retry = Retry(connect=3, backoff_factor=0.5)
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=self.concurrency)
+        session.mount("https://", adapter)
+        return session
+
     ##############
     # Get Header #
     ##############
@@ -52,89 +73,192 @@ class DocLink(BagelIntegration):
         login_url = base_url + "LoginCloud"
         login = f'{{ "SiteCode": "{self._doclink_site_code}", "UserId": "{self.doclink_username}", "Password": "{self._doclink_password}", "MachineName": "Jacob" }}'
 
-        response = requests.post(login_url, headers=header, data=login)
+        response = self.session.post(login_url, headers=header, data=login)
         doclink_authcode = str(response.json())
 
         return doclink_authcode
 
+    def doclink_get_authcode(self, expired=None):
+        """Logs in the first time it's called and afterwards only when `expired`, the
+        code a call was rejected with, is still the current one, so threads that
+        hit the same expiry share one new login."""
+        with self._auth_lock:
+            if self._doclink_authcode is None or self._doclink_authcode == expired:
+                header = self.doclink_get_header("")
+                self._doclink_authcode = self.doclink_login(
+                    self.doclink_base_url, header
+                )
+            return self._doclink_authcode
+
     ###########
     # Log out #
     ###########
 
     def doclink_logout(self, base_url, header):
         logout_url = base_url + "Logout"
-        requests.post(logout_url, headers=header)
+        self.session.post(logout_url, headers=header)
 
         return None
 
+    def close(self):
+        """logs out once, when the run ends. Bagel calls this while a table error
+        may be propagating, so a failed logout is only logged."""
+        if self._doclink_authcode:
+            header = self.doclink_get_header(self._doclink_authcode)
+            try:
+                self.doclink_logout(self.doclink_base_url, header)
+            except Exception as e:
+                logging.error(f"Logout failed: {e}")
+            self._doclink_authcode = None
+        self.session.close()
+
     ################################
     # Get Data (Make the API Call) #
     ################################
 
-    def doclink_api_call(self, table, run_date, base_url, header):
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("https://", adapter)
-
+    def doclink_api_call(self, table, arguments):
+        """runs `Custom_<table>` with `arguments`, e.g. `{"runDate": date}`"""
         # initialize variables
-        query_url = base_url + "ExecProcedure"
-        procedure_name = '"Custom_' + str(table) + '"'
-        body = f'{{ "ProcedureName": {procedure_name}, "Filters": [ {{"ArgumentName": "runDate", "ArgumentValue": "{run_date}"}} ] }}'
-        data = {}
-        dict_list = []
+        query_url = self.doclink_base_url + "ExecProcedure"
+        body = json.dumps(
+            {
+                "ProcedureName": f"Custom_{table}",
+                "Filters": [
+                    {"ArgumentName": name, "ArgumentValue": str(value)}
+                    for name, value in arguments.items()
+                ],
+            }
+        )
+        columnar_data = ColumnarData.from_rows([], [])
 
         # get the data for this page and add it to the final list
-        response = session.post(query_url, headers=header, data=body)
+        authcode = self.doclink_get_authcode()
+        response = self.session.post(
+            query_url, headers=self.doclink_get_header(authcode), data=body
+        )
+        data = self._doclink_decode(response)
+
+        # the AuthCode expired during the run: log in again and retry once
+        if self._doclink_auth_rejected(response, data):
+            authcode = self.doclink_get_authcode(expired=authcode)
+            response = self.session.post(
+                query_url, headers=self.doclink_get_header(authcode), data=body
+            )
+            data = self._doclink_decode(response)
 
         if response.status_code != 200:
             raise RuntimeError(
                 f"ERROR running {query_url}\n{response.status_code = }\n{response.text}"
             )
 
-        # the data returns with Columns separate from the Rows, so we need to rearrange to the standard key:value format
-        try:
-            data = response.json()
+        # the data returns with Columns separate from the Rows, which Bagel can serialize as-is
+        if isinstance(data, ValueError):
+            print("No Data Returned.")
+            return columnar_data
+
+        if not isinstance(data, list):
+            raise RuntimeError(f"ERROR running {query_url}\n{response.text}")
+
+        if data:
             cols = [x["Name"] for x in data[0]["Columns"]]
             rows = data[0]["Rows"]
-            for row in rows:
-                res = {}
-                for i, key in enumerate(cols):
-                    res[key] = row[i]
-                dict_list.append(res)
-        except ValueError:
-            print("No Data Returned.")
+            columnar_data = ColumnarData.from_rows(cols, rows)
 
-        return dict_list
+        return columnar_data
+
+    @staticmethod
+    def _doclink_decode(response):
+        """the JSON body of a 200, or the ValueError raised decoding it"""
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError as e:
+            return e
+
+    @staticmethod
+    def _doclink_auth_rejected(response, data):
+        """An expired AuthCode can come back as a 401/403, or as a 200 whose body
+        is an error message instead of the list of result sets."""
+        if response.status_code in (401, 403):
+            return True
+        if response.status_code != 200:
+            return False
+        # an empty body is a procedure that returned nothing
+        if isinstance(data, ValueError):
+            return False
+        return not isinstance(data, list)
 
     ########
     # MAIN #
     ########
 
-    def get_data(self, table: Table, last_run_timestamp, current_timestamp):
-        # initialize variables
-        doclink_authcode = ""
-        base_url = self.doclink_base_url
-        last_run_date = last_run_timestamp.date()
-
-        # initialize header
-        header = self.doclink_get_header(doclink_authcode)
+    def doclink_get_run_dates(
+        self, last_run_timestamp, current_timestamp, resume_state=None
+    ):
+        """the `runDate` of each day the window starts, from the first day not
+        uploaded yet when a failed run is resumed"""
+        run_dates = []
+        day = last_run_timestamp
+        while day < current_timestamp:
+            run_dates.append(day.date())
+            day += timedelta(days=1)
 
-        # log in to get auth code
-        doclink_authcode = self.doclink_login(base_url, header)
+        if resume_state:
+            run_dates = [
+                d for d in run_dates if d.isoformat() >= resume_state["run_date"]
+            ]
 
-        # now that we have the auth code, plug it into the header for the main API call
-        header = self.doclink_get_header(doclink_authcode)
+        return run_dates
 
-        # get the data for this page and add it to the final list
-        dict_list = self.doclink_api_call(table, last_run_date, base_url, header)
+    def get_data(self, table: Table, last_run_timestamp, current_timestamp):
+        run_dates = self.doclink_get_run_dates(
+            last_run_timestamp, current_timestamp, table.resume_state
+        )
+
+        concurrency = table.get_option("concurrency", self.concurrency)
+        target_rows = table.get_option("target_rows", self.target_rows)
+        api_call = partial(self.doclink_run_date_call, table)
+
+        # days are called concurrently but read in order; days are combined until
+        # they reach `target_rows`, and each Bite's checkpoint is the next day to run
+        span = []
+        for run_date, columnar_data in zip(
+            run_dates, bounded_map(api_call, run_dates, concurrency)
+        ):
+            span.append((run_date, columnar_data))
+            if sum(len(data) for _, data in span) >= target_rows:
+                yield self.doclink_span_bite(span)
+                span = []
+
+        if span:
+            yield self.doclink_span_bite(span)
 
-        # now that we have what we need, log out
-        self.doclink_logout(base_url, header)
+        return None
 
-        yield Bite(dict_list)
+    def doclink_run_date_call(self, table, run_date):
+        return self.doclink_api_call(table, {"runDate": run_date})
+
+    @staticmethod
+    def doclink_span_bite(span):
+        """one Bite for a list of consecutive `(run_date, columnar_data)` days"""
+        first, last = span[0][0], span[-1][0]
+        days = [data for _, data in span if data.columns]
+        columnar_data = ColumnarData.from_rows([], [])
+        if days:
+            columnar_data = ColumnarData.from_arrays(
+                days[0].columns,
+                [sum((d.column(c) for d in days), ()) for c in days[0].columns],
+            )
 
-        return None
+        file_name = first.isoformat()
+        if last != first:
+            file_name += f"_{last.isoformat()}"
+        return Bite(
+            columnar_data,
+            file_name=file_name,
+            checkpoint={"run_date": (last + timedelta(days=1)).isoformat()},
+        )
 
 
 ######################
@@ -0,0 +1,49 @@
+import json
+
+
+class MockResponse:
+    def __init__(self, json_data=None, status_code=200, text=None):
+        self.json_data = json_data
+        self.status_code = status_code
+        self.text = text if text is not None else json.dumps(json_data)
+        self.decodes = 0
+
+    def json(self):
+        self.decodes += 1
+        if self.json_data is None:
+            raise ValueError("No JSON object could be decoded")
+        return self.json_data
+
+
+fake_result_sets = [
+    {"Columns": [{"Name": "foo"}, {"Name": "baz"}], "Rows": [["bar", "spam"]]}
+]
+
+
+class FakeDocLinkSession:
+    """Answers LoginCloud with a new AuthCode per login and rejects procedure
+    calls made with an expired one using `expired_response`."""
+
+    def __init__(self, expired_response, logout_error=None):
+        self.expired_response = expired_response
+        self.logout_error = logout_error
+        self.logins = 0
+        self.calls = []
+
+    def post(self, url, headers=None, data=None):
+        endpoint = url.rsplit("/", 1)[1]
+        self.calls.append((endpoint, headers.get("AuthCode")))
+
+        if endpoint == "LoginCloud":
+            self.logins += 1
+            return MockResponse(f"code-{self.logins}")
+        if endpoint == "Logout":
+            if self.logout_error:
+                raise self.logout_error
+            return MockResponse("")
+        if headers["AuthCode"] == "code-1":
+            return self.expired_response
+        return MockResponse(fake_result_sets)
+
+    def close(self):
+        pass
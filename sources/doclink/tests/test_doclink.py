@@ -1,2 +1,127 @@
+import pytest
+import requests
+from datetime import datetime
+from unittest import mock
+
+from bagel.data import ColumnarData
+from bagel.table import Table
+
+from doclink.get_data import DocLink
+from .fakes import FakeDocLinkSession, MockResponse
+
+
 def test_function():
     assert True
+
+
+@pytest.fixture
+def doclink(monkeypatch):
+    for name in [
+        "DOCLINK_USERNAME",
+        "DOCLINK_PASSWORD",
+        "DOCLINK_SITE_CODE",
+    ]:
+        monkeypatch.setenv(name, "FAKE")
+    monkeypatch.setenv("DOCLINK_BASE_URL", "https://doclink/api/")
+
+    return DocLink()
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize(
+    "expired_response",
+    [
+        MockResponse(status_code=401, text="Unauthorized"),
+        MockResponse({"Message": "Invalid AuthCode"}),
+        MockResponse("Session expired"),
+    ],
+)
+def test_when_authcode_expires_then_logs_in_again_and_retries(
+    doclink, expired_response
+):
+    doclink.session = FakeDocLinkSession(expired_response)
+
+    result = doclink.doclink_api_call("documents", {"runDate": "2023-08-11"})
+
+    assert result == ColumnarData.from_rows(["foo", "baz"], [["bar", "spam"]])
+    assert doclink.session.logins == 2
+    assert expired_response.decodes <= 1
+
+
+@pytest.mark.unit_test
+def test_when_procedure_keeps_returning_an_error_body_then_raise_runtime_error(
+    doclink,
+):
+    doclink.session = mock.Mock()
+    doclink.session.post.side_effect = lambda url, **kwargs: (
+        MockResponse("code-1")
+        if url.endswith("LoginCloud")
+        else MockResponse({"Message": "Bad procedure"})
+    )
+
+    with pytest.raises(RuntimeError):
+        doclink.doclink_api_call("documents", {"runDate": "2023-08-11"})
+
+
+@pytest.mark.unit_test
+def test_when_procedure_returns_no_body_then_no_data_and_no_login_retry(doclink):
+    empty_response = MockResponse(text="")
+    doclink.session = FakeDocLinkSession(empty_response)
+
+    result = doclink.doclink_api_call("documents", {"runDate": "2023-08-11"})
+
+    assert len(result) == 0
+    assert doclink.session.logins == 1
+    assert empty_response.decodes == 1
+
+
+@pytest.mark.unit_test
+def test_when_logout_fails_on_close_then_error_is_logged_not_raised(doclink):
+    doclink.session = FakeDocLinkSession(
+        MockResponse(status_code=401),
+        logout_error=requests.exceptions.ConnectionError("logout failed"),
+    )
+    doclink.doclink_get_authcode()
+
+    with mock.patch("doclink.get_data.logging.error") as mock_error:
+        doclink.close()
+
+    mock_error.assert_called_once()
+    assert doclink._doclink_authcode is None
+
+
+@pytest.mark.unit_test
+def test_when_never_logged_in_then_close_does_not_log_out(doclink):
+    doclink.session = FakeDocLinkSession(MockResponse(status_code=401))
+
+    doclink.close()
+
+    assert doclink.session.calls == []
+
+
+@pytest.mark.unit_test
+def test_when_days_are_small_then_they_are_combined_up_to_target_rows(doclink):
+    rows = {1: 1, 2: 0, 3: 1, 4: 2, 5: 1}
+    doclink.doclink_run_date_call = lambda table, run_date: ColumnarData.from_rows(
+        ["day"] if rows[run_date.day] else [],
+        [[run_date.day]] * rows[run_date.day],
+    )
+    table = Table("Documents", {"target_rows": 2})
+
+    bites = list(doclink.get_data(table, datetime(2023, 8, 1), datetime(2023, 8, 6)))
+
+    assert [b.file_name for b in bites] == [
+        "2023-08-01_2023-08-03",
+        "2023-08-04",
+        "2023-08-05",
+    ]
+    assert [b.data for b in bites] == [
+        ColumnarData.from_rows(["day"], [[1], [3]]),
+        ColumnarData.from_rows(["day"], [[4], [4]]),
+        ColumnarData.from_rows(["day"], [[5]]),
+    ]
+    assert [b.checkpoint for b in bites] == [
+        {"run_date": "2023-08-04"},
+        {"run_date": "2023-08-05"},
+        {"run_date": "2023-08-06"},
+    ]
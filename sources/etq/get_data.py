@@ -1,29 +1,66 @@
-from datetime import datetime
+from contextlib import closing
+from itertools import count
 import os
 import requests
 import logging
-
-from bagel import Bagel, BagelIntegration, Bite, Table
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from bagel import (
+    Bagel,
+    BagelIntegration,
+    Bite,
+    ColumnarData,
+    Table,
+    filter_by_timestamp,
+)
+from bagel.concurrency import bounded_map
+from bagel.util import batched
 
 logging.basicConfig(
     level=logging.INFO,
     format='{"timestamp":"%(asctime)s", "level_name":"%(levelname)s", "function_name":"%(funcName)s", "line_number":"%(lineno)d", "message":"%(message)s"}',
 )
 
+# closed-by-number columns the DOCWORK_DOCUMENT and DOCWORK_ATTACHMENT tables need
+DOCWORK_ID_COLUMNS = ("DOCWORK_ID", "DOCWOR_DOCUMEN_ETQ$MODIFIE_DAT")
+
 
 class ETQDocuments(BagelIntegration):
 
     source = "etq"
     page_size = 2000
+    # datasource pages requested ahead of the one being yielded; tables.yaml `prefetch_pages` overrides it
+    prefetch_pages = 4
+    # docwork documents fetched at once and documents per Bite; tables.yaml `document_concurrency`/`document_batch_size` override them
+    document_concurrency = 8
+    document_batch_size = 100
+    pool_size = 16
+    # attachments are streamed to blob storage in chunks; a dropped connection resumes with a Range request
+    attachment_chunk_size = 1024 * 1024
+    attachment_max_attempts = 3
 
     def __post_init__(self) -> None:
         self._load_config()
+        self.session = self._get_session()
+        self._fingerprint_warned = False
 
     def _load_config(self):
         self._etq_user = os.getenv("ETQ_USER")
         self._etq_password = os.getenv("ETQ_PASSWORD")
         self.base_url = os.getenv("ETQ_BASE_URL")
 
+    def _get_session(self) -> requests.Session:
+        """One authenticated session with a connection pool shared by all requests."""
+        session = requests.Session()
+        session.auth = (self._etq_user, self._etq_password)
+        retry = Retry(connect=3, backoff_factor=0.5)
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=1, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        return session
+
     def get_data(self, table: Table, last_run_timestamp, current_timestamp):
         """`hasattr()` and `getattr()` are used here to dynamically call
         the corresponding function to the formatted table name if there is one.
@@ -37,27 +74,26 @@ class ETQDocuments(BagelIntegration):
         else:
             return self._get_datasource(table, last_run_timestamp, current_timestamp)
 
+    def _filter_closed_bynumber(
+        self, table, data, last_run_timestamp, current_timestamp
+    ):
+        if table.elt_type and table.elt_type == "delta":
+            data = filter_by_timestamp(
+                data,
+                "DOCWOR_DOCUMEN_ETQ$MODIFIE_DAT",
+                last_run_timestamp,
+                current_timestamp,
+                timestamp_format="%Y-%m-%d %H:%M:%S.%f",
+            )
+        return data
+
     def _docwork_closed_bynumber(self, table, last_run_timestamp, current_timestamp):
-        docword_records_raw = self._get_datasource(
+        for records in self._get_datasource(
             table, last_run_timestamp, current_timestamp
-        )
-        for records in docword_records_raw:
-
-            to_send = []
-            for record in records.data:
-
-                elt_type = table.elt_type
-                if elt_type and elt_type == "delta":
-                    modified_date = datetime.strptime(
-                        record["DOCWOR_DOCUMEN_ETQ$MODIFIE_DAT"], "%Y-%m-%d %H:%M:%S.%f"
-                    )
-                    lr_t: datetime = last_run_timestamp
-                    if modified_date.timestamp() <= lr_t.timestamp():
-                        continue
-
-                to_send.append(record)
-
-            yield to_send
+        ):
+            yield self._filter_closed_bynumber(
+                table, records.data, last_run_timestamp, current_timestamp
+            )
 
     def docwork_closed_bynumber(self, table, last_run_timestamp, current_timestamp):
         for r in self._docwork_closed_bynumber(
@@ -65,40 +101,70 @@ class ETQDocuments(BagelIntegration):
         ):
             yield Bite(r)
 
-    def _docwork_document(self, table: Table, last_run_timestamp, current_timestamp):
-
-        docwork_records = []
+    def _get_docwork_id_pages(self):
+        """The id and modified date of every closed docwork. The datasource isn't
+        windowed, so the DOCWORK_* tables of a run share one fetch of these two
+        columns and filter it to their own window."""
+        t = Table(name="docwork_closed_bynumber")
+        return self.cache.get_or_compute(
+            "docwork_ids",
+            lambda: [
+                records.data.select(*DOCWORK_ID_COLUMNS)
+                for records in self._get_datasource(t, None, None)
+                if len(records.data)
+            ],
+        )
 
-        t = Table(name="docwork_closed_bynumber", elt_type=table.elt_type)
+    def _docwork_ids(self, table: Table, last_run_timestamp, current_timestamp):
+        for d in self._get_docwork_id_pages():
+            d = self._filter_closed_bynumber(
+                table, d, last_run_timestamp, current_timestamp
+            )
+            if len(d):
+                yield from d.column("DOCWORK_ID")
 
-        for d in self._docwork_closed_bynumber(
-            t, last_run_timestamp, current_timestamp
-        ):
-            docwork_records += d
+    def _fetch_docwork_document(self, docwork_id):
+        doc_url = self.base_url + f"documents/DOCWORK/DOCWORK_DOCUMENT/{docwork_id}"
+        logging.info(f"{doc_url = }")
 
-        docs = []
-        for record in docwork_records:
+        response = self.session.get(doc_url)
 
-            doc_url = (
-                self.base_url
-                + f"documents/DOCWORK/DOCWORK_DOCUMENT/{record['DOCWORK_ID']}"
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"ERROR running {doc_url}\n{response.status_code = }\n{response.text}"
             )
-            logging.info(f"{doc_url = }")
 
-            response = requests.get(doc_url, auth=(self._etq_user, self._etq_password))
+        return response.json()
 
-            data = response.json()
-            docs.append(data)
+    def _docwork_document(self, table: Table, last_run_timestamp, current_timestamp):
+        """Streams docwork documents as they arrive, with at most
+        `document_concurrency` requests in flight. Documents aren't cached: each
+        DOCWORK_* table fetches the ones it needs and drops them once yielded."""
+        document_concurrency = table.get_option(
+            "document_concurrency", self.document_concurrency
+        )
 
-        return docs
+        yield from bounded_map(
+            self._fetch_docwork_document,
+            self._docwork_ids(table, last_run_timestamp, current_timestamp),
+            document_concurrency,
+            ordered=False,
+        )
 
     def docwork_document(self, table, last_run_timestamp, current_timestamp):
-        return Bite(
-            self._docwork_document(table, last_run_timestamp, current_timestamp)
+        document_batch_size = table.get_option(
+            "document_batch_size", self.document_batch_size
         )
 
-    def docwork_attachment(self, table, last_run_timestamp, current_timestamp):
+        for docs in batched(
+            self._docwork_document(table, last_run_timestamp, current_timestamp),
+            document_batch_size,
+        ):
+            yield Bite(docs)
 
+    def _docwork_attachments(self, table, last_run_timestamp, current_timestamp):
+        """Yields `(document_id, attachment_path, attachment_name)` of every pdf/docx
+        attachment of the docwork documents."""
         for data in self._docwork_document(
             table, last_run_timestamp, current_timestamp
         ):
@@ -124,56 +190,167 @@ class ETQDocuments(BagelIntegration):
                     ]
 
                     for attachment_name in attachment_name_list:
-                        attachment_url = (
-                            self.base_url
-                            + f"attachments?path={attachment_path}&name={attachment_name}"
-                        )
-                        logging.info(f"{attachment_url = }")
+                        yield document_id, attachment_path, attachment_name
+
+    def _attachment_url(self, attachment_path, attachment_name):
+        return (
+            self.base_url + f"attachments?path={attachment_path}&name={attachment_name}"
+        )
+
+    def docwork_attachment(self, table, last_run_timestamp, current_timestamp):
+        document_concurrency = table.get_option(
+            "document_concurrency", self.document_concurrency
+        )
+
+        def get_fingerprint(attachment):
+            _, attachment_path, attachment_name = attachment
+            url = self._attachment_url(attachment_path, attachment_name)
+            return attachment, self._attachment_fingerprint(url)
+
+        # the HEAD requests for the fingerprints run ahead of the uploads, in order
+        for attachment, fingerprint in bounded_map(
+            get_fingerprint,
+            self._docwork_attachments(table, last_run_timestamp, current_timestamp),
+            document_concurrency,
+        ):
+            document_id, attachment_path, attachment_name = attachment
+            attachment_url = self._attachment_url(attachment_path, attachment_name)
+            logging.info(f"{attachment_url = }")
+
+            combined_file_name = f"{document_id}-{attachment_name}"
+            # downloaded lazily, while Bagel uploads the Bite, and not at
+            # all when the index shows it already landed unchanged
+            yield Bite(
+                self._stream_attachment(attachment_url),
+                file_name=combined_file_name,
+                index_key=f"{document_id}|{attachment_path}|{attachment_name}",
+                fingerprint=fingerprint,
+            )
+
+    def _attachment_fingerprint(self, url):
+        """Size and last-modified from a HEAD request, or None (always download)
+        when the server doesn't report them."""
+        response = self.session.head(url)
+        if response.status_code != 200:
+            self._warn_no_fingerprint(f"HEAD returned {response.status_code}")
+            return None
+
+        size = response.headers.get("Content-Length")
+        last_modified = response.headers.get("Last-Modified")
+        if not (size or last_modified):
+            self._warn_no_fingerprint("HEAD has no Content-Length or Last-Modified")
+            return None
+
+        return f"{size}|{last_modified}"
+
+    def _warn_no_fingerprint(self, reason):
+        # once per run, rather than once per attachment
+        if not self._fingerprint_warned:
+            self._fingerprint_warned = True
+            logging.warning(
+                f"Attachments without a fingerprint are downloaded on every run: {reason}"
+            )
 
-                        file_content = requests.get(
-                            attachment_url, auth=(self._etq_user, self._etq_password)
-                        ).content
+    def _stream_attachment(self, url):
+        """Yields the attachment in chunks. If the connection drops part way the
+        download resumes from the last byte received instead of starting over."""
+        received = 0
+        attempt = 1
 
-                        combined_file_name = f"{document_id}-{attachment_name}"
-                        yield Bite(file_content, file_name=combined_file_name)
+        while True:
+            headers = {"Range": f"bytes={received}-"} if received else None
+            try:
+                with self.session.get(url, headers=headers, stream=True) as response:
+                    if response.status_code not in (200, 206):
+                        raise RuntimeError(
+                            f"ERROR running {url}\n{response.status_code = }\n{response.text}"
+                        )
+
+                    # server ignored the Range header and sent the whole file again
+                    skip = received if response.status_code == 200 else 0
+
+                    for chunk in response.iter_content(self.attachment_chunk_size):
+                        if skip:
+                            dropped = min(skip, len(chunk))
+                            chunk = chunk[dropped:]
+                            skip -= dropped
+                        if chunk:
+                            received += len(chunk)
+                            yield chunk
+                return
+
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+            ):
+                if attempt >= self.attachment_max_attempts:
+                    raise
+                logging.warning(
+                    f"Attachment download interrupted after {received} bytes, resuming: {url}"
+                )
+                attempt += 1
 
     def _get_datasource(self, table: Table, last_run_timestamp, current_timestamp):
         table_name = table.name
+        prefetch_pages = table.get_option("prefetch_pages", self.prefetch_pages)
 
-        page = 1
-        while True:
+        def get_page(page):
             datasource_url = (
                 self.base_url
                 + f"datasources/{table_name}/execute?pagesize={self.page_size}&pagenumber={page}"
             )
             logging.info(f"{datasource_url = }")
-            response = requests.get(
-                datasource_url, auth=(self._etq_user, self._etq_password)
-            )
+            response = self.session.get(datasource_url)
 
             if response.status_code != 200:
                 raise RuntimeError(
                     f"ERROR running {datasource_url}\n{response.status_code = }\n{response.text}"
                 )
 
-            d = response.json()
-
-            if d["count"] == 0:
-                return None
-
-            data = self._format_datasource_data(d)
-
-            yield Bite(data)
-
-            page += 1
-
-    def _format_datasource_data(self, d):
-        data = []
-        for record in d["Records"]:
-            columns = record["Columns"]
-            record_dict = {k: v for k, v in [(c["name"], c["value"]) for c in columns]}
-            data.append(record_dict)
-        return data
+            return response.json()
+
+        # keep `prefetch_pages` requests in flight; pages still come back in order
+        with closing(bounded_map(get_page, count(1), prefetch_pages)) as pages:
+            for d in pages:
+
+                if d["count"] == 0:
+                    return None
+
+                data = self._format_datasource_data(d)
+
+                yield Bite(data)
+
+                # a short page is the last one, no need to wait for an empty page
+                if d["count"] < self.page_size:
+                    return None
+
+    def _format_datasource_data(self, d) -> ColumnarData:
+        """Keeps every record as a row of values in one shared column order. Records
+        almost always list the same columns in the same order, so their values are
+        taken as they are; any other record is matched up by column name, with
+        `None` for the columns it doesn't have."""
+        records = d["Records"]
+        if not records:
+            return ColumnarData.from_rows([], [])
+
+        columns = [c["name"] for c in records[0]["Columns"]]
+        rows = []
+        for record in records:
+            names = [c["name"] for c in record["Columns"]]
+            if names == columns:
+                rows.append([c["value"] for c in record["Columns"]])
+                continue
+
+            values = {c["name"]: c["value"] for c in record["Columns"]}
+            for name in names:
+                if name not in columns:
+                    # a column missing from earlier records is None for them
+                    columns.append(name)
+                    for row in rows:
+                        row.append(None)
+            rows.append([values.get(name) for name in columns])
+
+        return ColumnarData.from_rows(columns, rows)
 
 
 if __name__ == "__main__":
@@ -27,13 +27,28 @@ class MockResponse:
         self.status_code = kwargs.get("status_code")
         self.text = kwargs.get("text", fake_text)
         self.content = kwargs.get("content")
+        self.headers = kwargs.get("headers", {})
 
     def json(self):
         return self.json_data
 
+    def iter_content(self, chunk_size=1):
+        content = self.content or b""
+        for i in range(0, len(content), chunk_size):
+            yield content[i : i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
 
 def mock_get_request(**kwargs) -> MockResponse:
     json_data = kwargs.get("json_data")
     status_code = kwargs.get("status_code", 200)
     content = kwargs.get("content")
-    return MockResponse(json_data=json_data, status_code=status_code, content=content)
+    headers = kwargs.get("headers", {})
+    return MockResponse(
+        json_data=json_data, status_code=status_code, content=content, headers=headers
+    )
@@ -1,8 +1,11 @@
 # test_etq.py
 
+from datetime import datetime
+
 import pytest
+import requests
 from unittest import mock
-from bagel.data import Bite
+from bagel.data import Bite, ColumnarData
 from bagel.table import Table
 
 from etq.get_data import ETQDocuments
@@ -95,10 +98,47 @@ def test_when_datasource_data_is_formatted_then_it_is_formatted_correctly(
     """
     input_ = fake_datasource_data
 
-    expected = [
-        {"foo": "bar", "baz": "spam", "ham": "eggs"},
-        {"foo": "rab", "baz": "maps", "ham": "sgge"},
-    ]
+    expected = ColumnarData.from_rows(
+        ["foo", "baz", "ham"],
+        [["bar", "spam", "eggs"], ["rab", "maps", "sgge"]],
+    )
+
+    result = etq_documents._format_datasource_data(input_)
+
+    assert result == expected, f"Expected {expected}, got {result}"
+
+
+@pytest.mark.unit_test
+def test_when_datasource_records_have_different_columns_then_values_are_matched_by_name(
+    etq_documents,
+):
+    input_ = {
+        "Records": [
+            {
+                "Columns": [
+                    {"name": "foo", "value": "bar"},
+                    {"name": "baz", "value": "spam"},
+                ]
+            },
+            {
+                "Columns": [
+                    {"name": "baz", "value": "maps"},
+                    {"name": "foo", "value": "rab"},
+                ]
+            },
+            {
+                "Columns": [
+                    {"name": "foo", "value": "oof"},
+                    {"name": "ham", "value": "eggs"},
+                ]
+            },
+        ]
+    }
+
+    expected = ColumnarData.from_rows(
+        ["foo", "baz", "ham"],
+        [["bar", "spam", None], ["rab", "maps", None], ["oof", None, "eggs"]],
+    )
 
     result = etq_documents._format_datasource_data(input_)
 
@@ -106,23 +146,24 @@ def test_when_datasource_data_is_formatted_then_it_is_formatted_correctly(
 
 
 @pytest.mark.unit_test
-@mock.patch("etq.get_data.requests.get")
+@mock.patch("etq.get_data.requests.Session.get")
 def test_when_datasource_is_fetched_then_json_is_reformatted_correctly(
-    mock_requests_get, etq_documents
+    mock_session_get, etq_documents
 ):
     """
     Test that fetching the datasource reformats JSON correctly.
     """
     expected = Bite(
-        [
-            {"foo": "bar", "baz": "spam", "ham": "eggs"},
-            {"foo": "rab", "baz": "maps", "ham": "sgge"},
-        ]
+        ColumnarData.from_rows(
+            ["foo", "baz", "ham"],
+            [["bar", "spam", "eggs"], ["rab", "maps", "sgge"]],
+        )
+    )
+    mock_session_get.side_effect = lambda url, **kwargs: (
+        mock_get_request(json_data=fake_datasource_data)
+        if url.endswith("pagenumber=1")
+        else mock_get_request(json_data={"count": 0})
     )
-    mock_requests_get.side_effect = [
-        mock_get_request(json_data=fake_datasource_data),
-        mock_get_request(json_data={"count": 0}),
-    ]
 
     result = etq_documents.get_data(Table("bar", "baz"), None, None)
 
@@ -134,24 +175,184 @@ def test_when_datasource_is_fetched_then_json_is_reformatted_correctly(
 
 
 @pytest.mark.unit_test
-@mock.patch("etq.get_data.requests.get")
+@mock.patch("etq.get_data.requests.Session.get")
+def test_when_full_pages_are_fetched_then_bites_are_yielded_in_page_order(
+    mock_session_get, etq_documents
+):
+    """
+    Test that prefetched pages are yielded in page order until a short page.
+    """
+    etq_documents.page_size = 2
+
+    def get_page(url, **kwargs):
+        page = int(url.split("pagenumber=")[1])
+        if page > 3:
+            return mock_get_request(json_data={"count": 0})
+        if page == 3:
+            records = fake_datasource_data["Records"][:1]
+        else:
+            records = fake_datasource_data["Records"]
+        return mock_get_request(json_data={"count": len(records), "Records": records})
+
+    mock_session_get.side_effect = get_page
+
+    result = list(
+        etq_documents.get_data(
+            Table.from_config({"name": "bar", "prefetch_pages": 2}), None, None
+        )
+    )
+
+    assert [len(bite.data) for bite in result] == [2, 2, 1]
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.ETQDocuments._get_datasource")
+def test_when_docwork_closed_bynumber_is_delta_then_only_window_rows_are_kept(
+    mock__get_datasource, etq_documents
+):
+    """
+    Test that delta loads only keep records modified inside the run window.
+    """
+    columns = ["DOCWORK_ID", "DOCWOR_DOCUMEN_ETQ$MODIFIE_DAT"]
+    mock__get_datasource.return_value = iter(
+        [
+            Bite(
+                ColumnarData.from_rows(
+                    columns,
+                    [
+                        ["1", "2022-01-01 00:00:00.000"],
+                        ["2", "2022-01-02 12:00:00.000"],
+                        ["3", "2022-01-04 00:00:00.000"],
+                    ],
+                )
+            )
+        ]
+    )
+    expected = [
+        Bite(ColumnarData.from_rows(columns, [["2", "2022-01-02 12:00:00.000"]]))
+    ]
+
+    result = list(
+        etq_documents.docwork_closed_bynumber(
+            Table("docwork_closed_bynumber", elt_type="delta"),
+            datetime(2022, 1, 2),
+            datetime(2022, 1, 3),
+        )
+    )
+
+    assert result == expected, f"Expected {expected}, got {result}"
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.ETQDocuments._get_datasource")
+def test_when_docwork_tables_share_a_run_then_datasource_is_fetched_once(
+    mock__get_datasource, etq_documents
+):
+    columns = ["DOCWORK_ID", "DOCWOR_DOCUMEN_ETQ$MODIFIE_DAT"]
+    mock__get_datasource.side_effect = lambda *args: iter(
+        [
+            Bite(
+                ColumnarData.from_rows(
+                    columns,
+                    [
+                        ["1", "2022-01-01 00:00:00.000"],
+                        ["2", "2022-01-02 12:00:00.000"],
+                    ],
+                )
+            )
+        ]
+    )
+
+    full = list(etq_documents._docwork_ids(Table("docwork_document"), None, None))
+    delta = list(
+        etq_documents._docwork_ids(
+            Table("docwork_attachment", elt_type="delta"),
+            datetime(2022, 1, 2),
+            datetime(2022, 1, 3),
+        )
+    )
+
+    assert full == ["1", "2"]
+    assert delta == ["2"]
+    assert mock__get_datasource.call_count == 1
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.ETQDocuments._get_datasource")
+def test_when_docwork_closed_bynumber_runs_then_pages_are_yielded_as_they_arrive(
+    mock__get_datasource, etq_documents
+):
+    fetched = []
+
+    def pages(*args):
+        for i in range(3):
+            fetched.append(i)
+            yield Bite(ColumnarData.from_rows(["DOCWORK_ID"], [[str(i)]]))
+
+    mock__get_datasource.side_effect = pages
+
+    result = etq_documents.docwork_closed_bynumber(
+        Table("docwork_closed_bynumber"), None, None
+    )
+
+    assert next(result).data.column("DOCWORK_ID") == ("0",)
+    assert fetched == [0]
+    assert len(etq_documents.cache) == 0
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.requests.Session.get")
+@mock.patch("etq.get_data.ETQDocuments._docwork_ids")
+def test_when_docwork_documents_are_fetched_then_they_are_yielded_in_batches(
+    mock__docwork_ids, mock_session_get, etq_documents
+):
+    """
+    Test that docwork documents are streamed into size-bounded Bites.
+    """
+    mock__docwork_ids.return_value = iter(["1", "2", "3", "4", "5"])
+    mock_session_get.side_effect = lambda url, **kwargs: mock_get_request(
+        json_data={"Document": [{"documentId": url.rsplit("/", 1)[1]}]}
+    )
+
+    result = list(
+        etq_documents.docwork_document(
+            Table.from_config({"name": "docwork_document", "document_batch_size": 2}),
+            None,
+            None,
+        )
+    )
+
+    assert [len(bite.data) for bite in result] == [2, 2, 1]
+    document_ids = sorted(
+        doc["Document"][0]["documentId"] for bite in result for doc in bite.data
+    )
+    assert document_ids == ["1", "2", "3", "4", "5"]
+    assert len(etq_documents.cache) == 0
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.requests.Session.get")
 def test_when_datasource_errors_then_raise_runtime_error(
-    mock_requests_get, etq_documents
+    mock_session_get, etq_documents
 ):
     """
     Test that a RuntimeError is raised when fetching the datasource results in an error.
     """
-    mock_requests_get.return_value = mock_get_request(status_code=404)
+    mock_session_get.return_value = mock_get_request(status_code=404)
 
     with pytest.raises(RuntimeError):
         next(etq_documents.get_data(Table("bar", "baz"), None, None))
 
 
 @pytest.mark.unit_test
-@mock.patch("etq.get_data.requests.get")  # Ensure this path is correct
+@mock.patch("etq.get_data.requests.Session.head")
+@mock.patch("etq.get_data.requests.Session.get")  # Ensure this path is correct
 @mock.patch("etq.get_data.ETQDocuments._docwork_document")
 def test_when_fetching_attachments_then_no_attachments_are_skipped(
-    mock__docwork_document, mock_requests_get, etq_documents  # Inject the fixture
+    mock__docwork_document,
+    mock_requests_get,
+    mock_requests_head,
+    etq_documents,  # Inject the fixture
 ):
     """
     Test that no attachments are skipped when fetching attachments.
@@ -272,12 +473,16 @@ def test_when_fetching_attachments_then_no_attachments_are_skipped(
         },
     ]
 
-    # Mock `requests.get` to handle multiple calls using `side_effect`
+    # Mock `Session.get` to handle multiple calls using `side_effect`
     mock_requests_get.side_effect = [
         mock_get_request(content=b"foo"),  # First attachment
         mock_get_request(content=b"bar"),  # Second attachment
     ]
 
+    mock_requests_head.return_value = mock_get_request(
+        headers={"Content-Length": "3", "Last-Modified": "Mon, 01 Jan 2024"}
+    )
+
     # Expected number of attachments is 2
     expected = 2
 
@@ -290,11 +495,77 @@ def test_when_fetching_attachments_then_no_attachments_are_skipped(
     ), f"Expected {expected} attachments, got {len(result)}"
 
     # Optionally, verify the contents of the attachments
-    assert result[0].data == b"foo", "First attachment content mismatch."
+    assert b"".join(result[0].data) == b"foo", "First attachment content mismatch."
     assert (
         result[0].file_name == "78-Post Market Surveillance.docx"
     ), "First attachment filename mismatch."
-    assert result[1].data == b"bar", "Second attachment content mismatch."
+    assert b"".join(result[1].data) == b"bar", "Second attachment content mismatch."
     assert (
         result[1].file_name == "78-Post Market Surveillance.PDF"
     ), "Second attachment filename mismatch."
+    assert result[0].index_key == "78|/7/37/0078/78/1233|Post Market Surveillance.docx"
+    assert result[0].fingerprint == "3|Mon, 01 Jan 2024"
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.requests.Session.head")
+def test_when_attachment_head_has_no_size_or_date_then_no_fingerprint(
+    mock_session_head, etq_documents
+):
+    mock_session_head.return_value = mock_get_request(headers={})
+
+    with mock.patch("etq.get_data.logging.warning") as mock_warning:
+        assert etq_documents._attachment_fingerprint("https://etq/a") is None
+        assert etq_documents._attachment_fingerprint("https://etq/b") is None
+
+    mock_warning.assert_called_once()
+
+
+class _DroppedResponse:
+    """Streams `content` and then drops the connection."""
+
+    status_code = 206
+
+    def __init__(self, content):
+        self.content = content
+
+    def iter_content(self, chunk_size=1):
+        yield self.content
+        raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.requests.Session.get")
+def test_when_attachment_download_drops_then_resume_from_received_bytes(
+    mock_session_get, etq_documents
+):
+    mock_session_get.side_effect = [
+        _DroppedResponse(b"foo"),
+        mock_get_request(status_code=206, content=b"bar"),
+    ]
+
+    result = b"".join(etq_documents._stream_attachment("https://etq/attachments"))
+
+    assert result == b"foobar"
+    assert mock_session_get.call_args.kwargs["headers"] == {"Range": "bytes=3-"}
+
+
+@pytest.mark.unit_test
+@mock.patch("etq.get_data.requests.Session.get")
+def test_when_resume_ignores_range_then_skip_received_bytes(
+    mock_session_get, etq_documents
+):
+    mock_session_get.side_effect = [
+        _DroppedResponse(b"foo"),
+        mock_get_request(status_code=200, content=b"foobar"),
+    ]
+
+    result = b"".join(etq_documents._stream_attachment("https://etq/attachments"))
+
+    assert result == b"foobar"
@@ -1,5 +1,6 @@
 import os
-from datetime import datetime
+from datetime import datetime, timezone
+from urllib.parse import quote
 import requests
 import logging
 from requests.adapters import HTTPAdapter
@@ -7,6 +8,9 @@ from urllib3.util.retry import Retry
 
 from bagel import Bagel, BagelIntegration, Bite, Table
 
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+KEYSET_FIELDS = ["sys_updated_on", "sys_id"]
+
 logging.basicConfig(
     level=logging.INFO,
     format='{"timestamp":"%(asctime)s", "level_name":"%(levelname)s", "function_name":"%(funcName)s", "line_number":"%(lineno)d", "message":"%(message)s"}',
@@ -23,25 +27,51 @@ class ITSMData(BagelIntegration):
 
     def __post_init__(self) -> None:
         self._load_config()
+        self.session = self._get_session()
 
     def _load_config(self):
         self._itsm_user = os.environ["ITSM_USER"]
         self._itsm_password = os.environ["ITSM_PASSWORD"]
         self.base_url = os.environ["ITSM_BASE_URL"]
 
+    def _get_session(self) -> requests.Session:
+        # set up request features to try again in case of ConnectionError (Max retries exceeded with url)
+        session = requests.Session()
+        session.auth = (self._itsm_user, self._itsm_password)
+        retry = Retry(connect=3, backoff_factor=0.5)
+        adapter = HTTPAdapter(max_retries=retry)
+        session.mount("https://", adapter)
+        return session
+
     ###########
     # Get URL #
     ###########
 
-    def itsm_get_url(self, table, page_size=50, offset=0):
+    def itsm_get_url(
+        self,
+        table,
+        last_run_timestamp,
+        current_timestamp,
+        page_size=500,
+        after=None,
+        fields=None,
+        display_value="all",
+    ):
         param_page_size = f"sysparm_limit={page_size}"
-        param_offset = f"sysparm_offset={offset}"
         PARAM_EXCLUDE_LINK = "sysparm_exclude_reference_link=true"
-        PARAM_INCLUDE_DV = "sysparm_display_value=all"
-        PARAM_ORDER_BY = "sysparm_query=ORDERBYDESCsys_updated_on, u_custname"
+        param_display_value = f"sysparm_display_value={display_value}"
+        # the total count is a second query on the server, and keyset paging doesn't need it
+        PARAM_NO_COUNT = "sysparm_no_count=true"
         PARAM_QA_TABLE_NAME = "table_name=x_ahho_compliance_request"
 
-        table_url = f"{self.base_url}{table}?{param_page_size}&{param_offset}&{PARAM_EXCLUDE_LINK}&{PARAM_INCLUDE_DV}&{PARAM_ORDER_BY}"
+        query = self.itsm_get_query(last_run_timestamp, current_timestamp, after)
+        param_query = f"sysparm_query={quote(query)}"
+
+        table_url = f"{self.base_url}{table}?{param_page_size}&{PARAM_EXCLUDE_LINK}&{param_display_value}&{PARAM_NO_COUNT}&{param_query}"
+
+        # only return the listed columns instead of every column of the table
+        if fields:
+            table_url += f"&sysparm_fields={quote(','.join(fields))}"
 
         # add an extra parameter to this table call to limit large dataset to return only relevant records
         if table.upper() == "QUESTION_ANSWER":
@@ -49,25 +79,102 @@ class ITSMData(BagelIntegration):
 
         return table_url
 
+    #############
+    # Get Query #
+    #############
+
+    def itsm_get_query(self, last_run_timestamp, current_timestamp, after=None):
+        """Encoded query for the rows updated in [last_run_timestamp, current_timestamp),
+        ordered by `sys_updated_on, sys_id` so each page starts right after the
+        (`sys_updated_on`, `sys_id`) of the last row of the previous one (`after`).
+
+        ServiceNow reads these dates in the integration user's time zone, which has
+        to be UTC like the `sys_updated_on` values it returns.
+        """
+        window = (
+            f"sys_updated_on>={self._date_generate(last_run_timestamp)}"
+            f"^sys_updated_on<{self._date_generate(current_timestamp)}"
+        )
+        ORDER_BY = "ORDERBYsys_updated_on^ORDERBYsys_id"
+
+        if after is None:
+            return f"{window}^{ORDER_BY}"
+
+        updated_on, sys_id = after
+        updated_on = self._date_generate(
+            datetime.strptime(updated_on, TIMESTAMP_FORMAT)
+        )
+
+        # ^NQ ORs the two conditions: a later update, or the same update and a later sys_id
+        return (
+            f"{window}^sys_updated_on>{updated_on}"
+            f"^NQ{window}^sys_updated_on={updated_on}^sys_id>{sys_id}"
+            f"^{ORDER_BY}"
+        )
+
+    def _date_generate(self, timestamp: datetime) -> str:
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(timezone.utc)
+        return (
+            f"javascript:gs.dateGenerate('{timestamp:%Y-%m-%d}','{timestamp:%H:%M:%S}')"
+        )
+
+    ####################
+    # Get Table Config #
+    ####################
+
+    def itsm_get_fields(self, table: Table):
+        """`fields` from tables.yaml, as a list or a comma separated string, plus the
+        keyset columns every page needs. None (the default) returns all columns."""
+        fields = table.get_option("fields")
+        if not fields:
+            return None
+
+        if isinstance(fields, str):
+            fields = fields.split(",")
+
+        fields = [f.strip() for f in fields if f.strip()]
+        for keyset_field in KEYSET_FIELDS:
+            if keyset_field not in fields:
+                fields.append(keyset_field)
+
+        return fields
+
+    def itsm_get_display_value(self, table: Table):
+        """`display_value` from tables.yaml: `all` (default) returns {value, display_value}
+        pairs, `false` raw values only and `true` display values only (keyset paging
+        then reads `sys_updated_on` in the user's date format, which must be the default)."""
+        display_value = table.get_option("display_value", "all")
+
+        # yaml reads true/false as booleans
+        if isinstance(display_value, bool):
+            display_value = str(display_value).lower()
+
+        if display_value not in ("all", "true", "false"):
+            raise ValueError(
+                f"display_value must be all, true or false. Not {display_value}"
+            )
+
+        return display_value
+
     ################################
     # Get Data (Make the API Call) #
     ################################
 
     def itsm_api_call(self, url):
 
-        # set up request features to try again in case of ConnectionError (Max retries exceeded with url)
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("https://", adapter)
-
         # get the data for this page
-        response = session.get(url, auth=(self._itsm_user, self._itsm_password))
+        response = self.session.get(url)
+
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"ERROR running {url}\n{response.status_code = }\n{response.text}"
+            )
+
         data = response.json()
         data_list = [data]
-        total_row_count = int(response.headers["X-Total-Count"])
 
-        return data_list, total_row_count
+        return data_list
 
     ########
     # MAIN #
@@ -76,53 +183,48 @@ class ITSMData(BagelIntegration):
     def get_data(self, table: Table, last_run_timestamp, current_timestamp):
 
         # initialize variables
-        data = {}
-        current_offset = 0
-        per_page = 500
-        out_of_bounds = False
-        min_updated_datetime = datetime.now()
+        per_page = table.get_option("page_size", 500)
+        fields = self.itsm_get_fields(table)
+        display_value = self.itsm_get_display_value(table)
+        after = None
+        table_name = table.name
 
-        while min_updated_datetime >= last_run_timestamp and not out_of_bounds:
+        while True:
 
             # set the url for the current page
-            table_name = table.name
             self.next_url = self.itsm_get_url(
                 table_name,
+                last_run_timestamp,
+                current_timestamp,
                 page_size=per_page,
-                offset=current_offset,
-            )
-
-            # get the data for this page and add it to the final list
-            data, total_row_count = self.itsm_api_call(self.next_url)
-
-            # check the number of actual rows returned in case it is under the set per_page number
-            if current_offset + per_page > total_row_count:
-                per_page = int(abs(total_row_count - current_offset))
-
-            # update loop variables
-            min_updated_datetime = datetime.strptime(
-                data[0]["result"][per_page - 1]["sys_updated_on"]["value"],
-                "%Y-%m-%d %H:%M:%S",
+                after=after,
+                fields=fields,
+                display_value=display_value,
             )
-            current_offset += per_page
-            if total_row_count <= current_offset:
-                out_of_bounds = True
 
-            # before appending everything but after setting the variable, only add things from data to dict_list that are from the load datetime or more recent
-            dict_list = []
+            # get the data for this page, only rows inside the load window are returned
+            data = self.itsm_api_call(self.next_url)
+            rows = data[0]["result"]
 
-            for row in range(per_page):
-                updated_datetime = datetime.strptime(
-                    data[0]["result"][row]["sys_updated_on"]["value"],
-                    "%Y-%m-%d %H:%M:%S",
-                )
+            if rows:
+                yield Bite(rows)
 
-                if updated_datetime >= last_run_timestamp:
-                    dict_list.append(data[0]["result"][row])
+            # a short page is the last one
+            if len(rows) < per_page:
+                return None
 
-            yield Bite(dict_list)
+            # the next page starts after the last row of this one
+            last_row = rows[-1]
+            after = (
+                self._field_value(last_row["sys_updated_on"]),
+                self._field_value(last_row["sys_id"]),
+            )
 
-        return None
+    @staticmethod
+    def _field_value(field):
+        # with `sysparm_display_value=all` fields come back as {"display_value", "value"},
+        # otherwise as plain strings
+        return field["value"] if isinstance(field, dict) else field
 
 
 ######################
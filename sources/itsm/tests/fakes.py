@@ -1,3 +1,6 @@
+import re
+from urllib.parse import parse_qs, urlsplit
+
 fake_datasource_data = {
     "count": 2,
     "Records": [
@@ -37,3 +40,46 @@ def mock_get_request(**kwargs) -> MockResponse:
     status_code = kwargs.get("status_code", 200)
     content = kwargs.get("content")
     return MockResponse(json_data=json_data, status_code=status_code, content=content)
+
+
+class FakeServiceNowTable:
+    """Answers the keyset-paged table API queries built by `ITSMData.itsm_get_url`:
+    rows inside the query window, after the (`sys_updated_on`, `sys_id`) of the
+    `^NQ` condition, ordered by both, `sysparm_limit` at a time."""
+
+    DATE = r"javascript:gs.dateGenerate\('([\d-]+)','([\d:]+)'\)"
+
+    def __init__(self, rows):
+        # rows of (sys_updated_on, sys_id), returned with `sysparm_display_value=all`
+        self.rows = sorted(rows)
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        params = parse_qs(urlsplit(url).query)
+        query = params["sysparm_query"][0]
+        limit = int(params["sysparm_limit"][0])
+
+        start = self._timestamp(
+            *re.search(f"sys_updated_on>={self.DATE}", query).groups()
+        )
+        end = self._timestamp(*re.search(f"sys_updated_on<{self.DATE}", query).groups())
+        rows = [r for r in self.rows if start <= r[0] < end]
+
+        after = re.search(f"sys_updated_on={self.DATE}\\^sys_id>(\\w+)", query)
+        if after:
+            date, time, sys_id = after.groups()
+            rows = [r for r in rows if r > (self._timestamp(date, time), sys_id)]
+
+        result = [
+            {
+                "sys_updated_on": {"value": updated_on, "display_value": updated_on},
+                "sys_id": {"value": sys_id, "display_value": sys_id},
+            }
+            for updated_on, sys_id in rows[:limit]
+        ]
+        return MockResponse(json_data={"result": result}, status_code=200)
+
+    @staticmethod
+    def _timestamp(date, time):
+        return f"{date} {time}"
@@ -1,2 +1,121 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from bagel.table import Table
+
+from itsm.get_data import ITSMData
+from .fakes import FakeServiceNowTable
+
+
 def test_function():
     assert True
+
+
+@pytest.fixture
+def itsm(monkeypatch):
+    monkeypatch.setenv("ITSM_USER", "FAKE_USER")
+    monkeypatch.setenv("ITSM_PASSWORD", "FAKE_PASSWORD")
+    monkeypatch.setenv("ITSM_BASE_URL", "https://itsm/api/now/table/")
+
+    return ITSMData()
+
+
+WINDOW = (
+    "sys_updated_on>=javascript:gs.dateGenerate('2024-01-01','00:00:00')"
+    "^sys_updated_on<javascript:gs.dateGenerate('2024-01-02','00:00:00')"
+)
+
+
+@pytest.mark.unit_test
+def test_when_first_page_then_query_is_the_window_ordered_by_keyset(itsm):
+    query = itsm.itsm_get_query(datetime(2024, 1, 1), datetime(2024, 1, 2))
+
+    assert query == f"{WINDOW}^ORDERBYsys_updated_on^ORDERBYsys_id"
+
+
+@pytest.mark.unit_test
+def test_when_next_page_then_query_starts_after_last_row(itsm):
+    query = itsm.itsm_get_query(
+        datetime(2024, 1, 1),
+        datetime(2024, 1, 2),
+        after=("2024-01-01 05:06:07", "abc123"),
+    )
+
+    updated_on = "javascript:gs.dateGenerate('2024-01-01','05:06:07')"
+    assert query == (
+        f"{WINDOW}^sys_updated_on>{updated_on}"
+        f"^NQ{WINDOW}^sys_updated_on={updated_on}^sys_id>abc123"
+        "^ORDERBYsys_updated_on^ORDERBYsys_id"
+    )
+
+
+@pytest.mark.unit_test
+def test_when_timestamps_are_aware_then_query_is_in_utc(itsm):
+    eastern = timezone(timedelta(hours=-5))
+
+    query = itsm.itsm_get_query(
+        datetime(2023, 12, 31, 19, tzinfo=eastern),
+        datetime(2024, 1, 1, 19, tzinfo=eastern),
+    )
+
+    assert query.startswith(WINDOW)
+
+
+@pytest.mark.unit_test
+def test_when_url_is_built_then_it_has_no_count_and_keyset_fields(itsm):
+    table = Table.from_config(
+        {"name": "incident", "fields": "number, short_description"}
+    )
+
+    url = itsm.itsm_get_url(
+        table.name,
+        datetime(2024, 1, 1),
+        datetime(2024, 1, 2),
+        page_size=100,
+        fields=itsm.itsm_get_fields(table),
+    )
+    params = parse_qs(urlsplit(url).query)
+
+    assert params["sysparm_limit"] == ["100"]
+    assert params["sysparm_no_count"] == ["true"]
+    assert params["sysparm_fields"] == [
+        "number,short_description,sys_updated_on,sys_id"
+    ]
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("row_count", [20, 21])
+def test_when_many_rows_share_an_update_time_then_every_row_is_returned_once(
+    itsm, row_count
+):
+    # most rows tie on sys_updated_on, so page boundaries fall inside the tie
+    rows = [("2024-01-01 05:00:00", f"{i:03}") for i in range(row_count - 4)]
+    rows += [
+        ("2023-12-31 23:59:59", "early"),
+        ("2024-01-01 04:00:00", "zzz"),
+        ("2024-01-01 06:00:00", "aaa"),
+        ("2024-01-02 00:00:00", "late"),
+    ]
+    server = FakeServiceNowTable(rows)
+    itsm.session.get = server.get
+
+    bites = list(
+        itsm.get_data(
+            Table.from_config({"name": "incident", "page_size": 3}),
+            datetime(2024, 1, 1),
+            datetime(2024, 1, 2),
+        )
+    )
+
+    returned = [
+        (row["sys_updated_on"]["value"], row["sys_id"]["value"])
+        for bite in bites
+        for row in bite.data
+    ]
+    in_window = sorted(r for r in rows if "2024-01-01" <= r[0] < "2024-01-02")
+    assert returned == in_window
+    assert all(0 < len(bite.data) <= 3 for bite in bites)
+    # a full last page needs one more request to find out it was the last
+    assert len(server.urls) == len(in_window) // 3 + 1
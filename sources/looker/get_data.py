@@ -1,10 +1,18 @@
+import copy
+import csv
+import io
 import os
+import time
 import requests
 import json
 import datetime
 import logging
 
-from bagel import Bagel, BagelIntegration, Bite, Table
+from bagel import Bagel, BagelIntegration, Bite, Table, stream_json_bites
+from bagel.util import batched
+
+# query task statuses that will never become `complete`
+FAILED_TASK_STATUSES = ["error", "killed", "expired"]
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,9 +23,22 @@ logging.basicConfig(
 class Looker(BagelIntegration):
 
     source = "looker"
+    # rows per Bite; tables.yaml `batch_size` overrides it
+    batch_size = 10000
+    # seconds between status checks of a query task, doubling up to the max
+    poll_interval = 0.5
+    poll_max_interval = 10
+    # seconds a query task may take; tables.yaml `query_timeout` overrides it
+    query_timeout = 3600
+    # seconds before the access token expires that a new one is requested
+    token_refresh_margin = 300
 
     def __post_init__(self) -> None:
         self._load_config()
+        # one access token per run, see `looker_get_headers`
+        self._headers = None
+        self._token_expires_at = 0
+        self.payloads = self._load_payloads()
 
     def _load_config(self):
         self.__base_url = (
@@ -31,20 +52,38 @@ class Looker(BagelIntegration):
 
     def get_data(self, table: Table, last_run_timestamp, current_timestamp):
 
-        headers = self.looker_login()
-        data = self.looker_get_data(
+        headers = self.looker_get_headers()
+        yield from self.looker_get_data(
             headers, table, last_run_timestamp, current_timestamp
         )
-        return Bite(data)
+
+    def _load_payloads(self):
+        """Reads every query under `queries/` once, when the integration starts."""
+        query_dir = os.sep.join(
+            [os.path.dirname(os.path.realpath(__file__)), "queries"]
+        )
+        payloads = {}
+        for file_name in os.listdir(query_dir):
+            table_name, extension = os.path.splitext(file_name)
+            if extension == ".json":
+                with open(os.path.join(query_dir, file_name), "r") as fil:
+                    payloads[table_name] = json.load(fil)
+        return payloads
 
     def get_data_payload(self, table_name: str):
         """
+        Returns a copy of the query loaded at startup, as the caller sets its filters.
+        Queries that weren't there at startup are read from disk.
+
         Don't know what os this can run on, but we assume the same file structure, e.g.
         this file sits in the same directory as the queries.
         We find the table under the "query" directory.
         The query directory is assume to be under the directory that this file is contained in.
         However, since we don't know the os, we separate out terms via os.sep (which is os dependent)
         """
+        if table_name in self.payloads:
+            return copy.deepcopy(self.payloads[table_name])
+
         with open(
             os.sep.join(
                 [
@@ -66,9 +105,21 @@ class Looker(BagelIntegration):
             "authorization": "Bearer " + data["access_token"],
             "cache-control": "no-cache",
         }
+        # Looker tokens last an hour unless the response says otherwise
+        self._token_expires_at = time.monotonic() + data.get("expires_in", 3600)
         logging.info(f"got auth headers...")
         return headers
 
+    def looker_get_headers(self):
+        """Returns the headers of the run's access token, logging in again only when
+        it is within `token_refresh_margin` seconds of expiring."""
+        if (
+            self._headers is None
+            or time.monotonic() >= self._token_expires_at - self.token_refresh_margin
+        ):
+            self._headers = self.looker_login()
+        return self._headers
+
     def looker_get_data(
         self,
         headers,
@@ -76,10 +127,45 @@ class Looker(BagelIntegration):
         last_run_timestamp=None,
         current_timestamp=None,
     ):
-
-        query_url = f"{self.__base_url}/queries/run/json"
+        """
+        Runs the table's query as an async query task, so Looker queues it instead of
+        holding the request open, and streams the results into Bites of at most
+        `batch_size` rows. Tables with `file_format: csv` get CSV results.
+        """
         logging.info(f"table: {table}")
 
+        data_payload = self.looker_get_payload(
+            table, last_run_timestamp, current_timestamp
+        )
+        result_format = "csv" if table.file_format == "csv" else "json"
+        batch_size = table.get_option("batch_size", self.batch_size)
+        query_timeout = table.get_option("query_timeout", self.query_timeout)
+
+        query_id = self.looker_create_query(headers, data_payload)
+        task_id = self.looker_create_query_task(headers, query_id, result_format)
+        self.looker_wait_for_query_task(task_id, query_timeout)
+
+        # the token can expire while a long query runs
+        response = self.looker_request(
+            "GET",
+            f"/query_tasks/{task_id}/results",
+            self.looker_get_headers(),
+            stream=True,
+        )
+        try:
+            if result_format == "csv":
+                yield from self._stream_csv_bites(response, batch_size)
+            else:
+                yield from stream_json_bites(response, "*", batch_size)
+        finally:
+            response.close()
+
+    def looker_get_payload(
+        self,
+        table: Table,
+        last_run_timestamp=None,
+        current_timestamp=None,
+    ):
         data_payload = self.get_data_payload(table.name)
         elt_type = table.elt_type
 
@@ -103,10 +189,74 @@ class Looker(BagelIntegration):
             raise Exception("Invalid elt_type in tables.yaml file")
 
         logging.info(f"data_payload: {data_payload}")
+        return data_payload
 
-        response = requests.post(url=query_url, json=data_payload, headers=headers)
-        data = response.json()
-        return data
+    def looker_request(self, method, path, headers, **kwargs):
+        url = f"{self.__base_url}{path}"
+        response = requests.request(method, url=url, headers=headers, **kwargs)
+
+        if not response.ok:
+            raise RuntimeError(
+                f"ERROR running {url}\n{response.status_code = }\n{response.text}"
+            )
+
+        return response
+
+    def looker_create_query(self, headers, data_payload):
+        response = self.looker_request("POST", "/queries", headers, json=data_payload)
+        return response.json()["id"]
+
+    def looker_create_query_task(self, headers, query_id, result_format="json"):
+        response = self.looker_request(
+            "POST",
+            "/query_tasks",
+            headers,
+            json={"query_id": query_id, "result_format": result_format},
+        )
+        task_id = response.json()["id"]
+        logging.info(f"created query task {task_id} for query {query_id}")
+        return task_id
+
+    def looker_wait_for_query_task(self, task_id, timeout):
+        """Polls the query task, backing off exponentially, until it completes. Each
+        poll gets the headers from `looker_get_headers`, so a token that expires
+        during a long wait is renewed."""
+        deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+
+        while True:
+            response = self.looker_request(
+                "GET", f"/query_tasks/{task_id}", self.looker_get_headers()
+            )
+            status = response.json()["status"]
+
+            if status == "complete":
+                return
+            if status in FAILED_TASK_STATUSES:
+                raise RuntimeError(f"Query task {task_id} ended with status {status}")
+            if time.monotonic() + interval > deadline:
+                raise TimeoutError(
+                    f"Query task {task_id} did not complete in {timeout} seconds"
+                )
+
+            time.sleep(interval)
+            interval = min(interval * 2, self.poll_max_interval)
+
+    def _stream_csv_bites(self, response, batch_size):
+        """Re-chunks a streamed CSV response into Bites of at most `batch_size`
+        rows, each starting with the header row."""
+        response.raw.decode_content = True
+        rows = csv.reader(io.TextIOWrapper(response.raw, encoding="utf-8", newline=""))
+        header = next(rows, None)
+        if header is None:
+            return
+
+        for batch in batched(rows, batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(header)
+            writer.writerows(batch)
+            yield Bite(buffer.getvalue().encode("utf-8"))
 
     def _format_to_looker_time(self, timestamp):
         if isinstance(timestamp, datetime.datetime):
@@ -1,3 +1,7 @@
+import io
+import json
+
+
 def mock_post_request(**kwargs):
     url = kwargs.get("url", None)
     params = kwargs.get("params", None)
@@ -18,10 +22,38 @@ def mock_get_request(self, **kwargs):
     pass
 
 
+FAKE_ROWS = [{"val1": "a", "val2": "a"}, {"val1": "b", "val2": "b"}]
+FAKE_CSV = b"val1,val2\na,a\nb,b\n"
+
+
+def mock_request(method, **kwargs):
+    """Answers the query task calls: create query, create task, poll, results."""
+    url = kwargs.get("url", "")
+    if method == "POST" and url.endswith("/queries"):
+        return MockResponse(json_data={"id": "fake_query_id"}, status_code=200)
+    elif method == "POST" and url.endswith("/query_tasks"):
+        return MockResponse(json_data={"id": "fake_task_id"}, status_code=200)
+    elif url.endswith("/results"):
+        return MockResponse(content=json.dumps(FAKE_ROWS).encode(), status_code=200)
+    else:
+        return MockResponse(json_data={"status": "complete"}, status_code=200)
+
+
 class MockResponse:
     def __init__(self, **kwargs):
         self.json_data = kwargs.get("json_data", None)
         self.status_code = kwargs.get("status_code", None)
+        self.content = kwargs.get("content", b"")
+        self.raw = io.BytesIO(self.content)
+        self.text = self.content.decode()
+        self.ok = self.status_code is not None and self.status_code < 400
+        self.closed = False
 
     def json(self):
         return self.json_data
+
+    def iter_content(self, chunk_size=1):
+        yield self.content
+
+    def close(self):
+        self.closed = True
@@ -4,13 +4,20 @@ import os
 from bagel.table import Table
 import requests
 import secrets
+import time
 
 import pytest
 import unittest
 from unittest import mock
 
 from looker.get_data import Looker
-from looker.tests.fakes import mock_post_request
+from looker.tests.fakes import (
+    FAKE_CSV,
+    FAKE_ROWS,
+    MockResponse,
+    mock_post_request,
+    mock_request,
+)
 
 
 class TestLooker(unittest.TestCase):
@@ -158,6 +165,43 @@ class TestLooker(unittest.TestCase):
         )
         self.assertDictEqual(headers, self.fake_headers)
 
+    @pytest.mark.unit_test
+    @mock.patch("looker.get_data.requests.post")
+    def test_when_looker_get_headers_called_twice_then_logs_in_once(
+        self, mock_requests_post
+    ):
+        mock_requests_post.side_effect = mock_post_request
+
+        first = self.lk.looker_get_headers()
+        second = self.lk.looker_get_headers()
+
+        assert mock_requests_post.call_count == 1
+        self.assertDictEqual(first, second)
+
+    @pytest.mark.unit_test
+    @mock.patch("looker.get_data.requests.post")
+    def test_when_token_is_near_expiry_then_looker_get_headers_logs_in_again(
+        self, mock_requests_post
+    ):
+        mock_requests_post.side_effect = mock_post_request
+
+        self.lk.looker_get_headers()
+        self.lk._token_expires_at = 0
+        self.lk.looker_get_headers()
+
+        assert mock_requests_post.call_count == 2
+
+    @pytest.mark.unit_test
+    @mock.patch("looker.get_data.open")
+    def test_when_get_data_payload_called_for_a_loaded_query_then_returns_a_copy_without_reading_disk(
+        self, mock_open
+    ):
+        payload = self.lk.get_data_payload("history")
+        payload["filters"] = None
+
+        assert not mock_open.called
+        assert self.lk.get_data_payload("history")["filters"] is not None
+
     # technically not a unit_test, but including anyway
     @pytest.mark.unit_test
     def test_when_login_with_invalid_url_then_should_raise_ConnectionError(self):
@@ -198,7 +242,7 @@ class TestLooker(unittest.TestCase):
         mock_get_data.return_value = []
         mock_login.return_value = self.fake_headers
 
-        self.lk.get_data(self.fake_table, None, None)
+        list(self.lk.get_data(self.fake_table, None, None))
 
         mock_login.assert_called()
         mock_get_data.assert_called_with(self.fake_headers, self.fake_table, None, None)
@@ -214,10 +258,12 @@ class TestLooker(unittest.TestCase):
         mock_get_data.return_value = []
         mock_login.return_value = self.fake_headers
 
-        self.lk.get_data(
-            table=self.fake_table,
-            last_run_timestamp=self.last_run_timestamp,
-            current_timestamp=self.current_timestamp,
+        list(
+            self.lk.get_data(
+                table=self.fake_table,
+                last_run_timestamp=self.last_run_timestamp,
+                current_timestamp=self.current_timestamp,
+            )
         )
 
         mock_login.assert_called()
@@ -238,36 +284,27 @@ class TestLooker(unittest.TestCase):
         t = Table(name=self.fake_table_name, elt_type=self.elt_type["DNE"])
 
         with self.assertRaises(Exception, msg="Invalid elt_type in tables.yaml file"):
-            self.lk.looker_get_data(
-                self.fake_table,
-            )
+            self.lk.looker_get_payload(t)
 
     @pytest.mark.unit_test
-    @mock.patch("looker.get_data.requests.post")
     @mock.patch("looker.get_data.Looker.get_data_payload")
     def test_when_passing_full_elt_type_then_set_payload_filters_value_to_None(
-        self, mock_get_data_payload, mock_requests_post
+        self, mock_get_data_payload
     ):
         table = Table(name=self.fake_table_name, elt_type=self.elt_type["full"])
-        mock_requests_post.side_effect = mock_post_request
         fake_data_payload = dict({"foo": "bar", "filters": "bar"})
         mock_get_data_payload.return_value = fake_data_payload
 
-        self.lk.looker_get_data(
-            headers=self.fake_headers,
-            table=table,
-        )
+        self.lk.looker_get_payload(table=table)
 
         self.assertDictEqual(fake_data_payload, dict({"foo": "bar", "filters": None}))
 
     @pytest.mark.unit_test
-    @mock.patch("looker.get_data.requests.post")
     @mock.patch("looker.get_data.Looker.get_data_payload")
     def test_when_passing_delta_elt_type_then_call_format_looker_and_change_field_name(
-        self, mock_get_data_payload, mock_requests_post
+        self, mock_get_data_payload
     ):
         table = Table(name=self.fake_table_name, elt_type=self.elt_type["delta"])
-        mock_requests_post.side_effect = mock_post_request
         fake_data_payload = dict(
             {
                 "foo": "bar",
@@ -278,8 +315,7 @@ class TestLooker(unittest.TestCase):
         mock_get_data_payload.return_value = fake_data_payload
         expected_created_time = f"{self.lk._format_to_looker_time(self.lk._set_last_run_time(self.last_run_timestamp))} to {self.lk._format_to_looker_time(self.current_timestamp)}"
 
-        self.lk.looker_get_data(
-            headers=self.fake_headers,
+        self.lk.looker_get_payload(
             table=table,
             last_run_timestamp=self.last_run_timestamp,
             current_timestamp=self.current_timestamp,
@@ -297,20 +333,16 @@ class TestLooker(unittest.TestCase):
             ),
         )
 
-        mock_requests_post.assert_called_with(
-            url=f"{self.lk._Looker__base_url}/queries/run/json",
-            json=fake_data_payload,
-            headers=self.fake_headers,
-        )
-
     @pytest.mark.unit_test
-    @mock.patch("looker.get_data.requests.post")
+    @mock.patch("looker.get_data.Looker.looker_get_headers")
+    @mock.patch("looker.get_data.requests.request")
     @mock.patch("looker.get_data.Looker.get_data_payload")
-    def test_when_calling_looker_get_data_then_expect_result_to_be_a_json_array(
-        self, mock_get_data_payload, mock_requests_post
+    def test_when_calling_looker_get_data_then_expect_bites_of_json_rows(
+        self, mock_get_data_payload, mock_requests_request, mock_get_headers
     ):
+        mock_get_headers.return_value = self.fake_headers
         table = Table(name=self.fake_table_name, elt_type=self.elt_type["delta"])
-        mock_requests_post.side_effect = mock_post_request
+        mock_requests_request.side_effect = mock_request
         fake_data_payload = dict(
             {
                 "foo": "bar",
@@ -320,16 +352,126 @@ class TestLooker(unittest.TestCase):
 
         mock_get_data_payload.return_value = fake_data_payload
 
-        data = self.lk.looker_get_data(
+        bites = list(
+            self.lk.looker_get_data(
+                headers=self.fake_headers,
+                table=table,
+                last_run_timestamp=self.last_run_timestamp,
+                current_timestamp=self.current_timestamp,
+            )
+        )
+
+        assert [bite.data for bite in bites] == [FAKE_ROWS]
+        base_url = self.lk._Looker__base_url
+        mock_requests_request.assert_any_call(
+            "POST",
+            url=f"{base_url}/queries",
             headers=self.fake_headers,
-            table=table,
-            last_run_timestamp=self.last_run_timestamp,
-            current_timestamp=self.current_timestamp,
+            json=fake_data_payload,
+        )
+        mock_requests_request.assert_any_call(
+            "POST",
+            url=f"{base_url}/query_tasks",
+            headers=self.fake_headers,
+            json={"query_id": "fake_query_id", "result_format": "json"},
+        )
+        mock_requests_request.assert_called_with(
+            "GET",
+            url=f"{base_url}/query_tasks/fake_task_id/results",
+            headers=self.fake_headers,
+            stream=True,
+        )
+
+    @pytest.mark.unit_test
+    @mock.patch("looker.get_data.Looker.looker_get_headers")
+    @mock.patch("looker.get_data.requests.request")
+    @mock.patch("looker.get_data.Looker.get_data_payload")
+    def test_when_table_file_format_is_csv_then_results_are_split_into_csv_bites_with_header(
+        self, mock_get_data_payload, mock_requests_request, mock_get_headers
+    ):
+        mock_get_headers.return_value = self.fake_headers
+        table = Table(
+            name=self.fake_table_name,
+            elt_type=self.elt_type["full"],
+            file_format="csv",
+            raw_config={"batch_size": 1},
+        )
+        mock_get_data_payload.return_value = {"filters": None}
+
+        def csv_request(method, **kwargs):
+            if kwargs["url"].endswith("/results"):
+                return MockResponse(content=FAKE_CSV, status_code=200)
+            return mock_request(method, **kwargs)
+
+        mock_requests_request.side_effect = csv_request
+
+        bites = list(self.lk.looker_get_data(self.fake_headers, table))
+
+        assert [bite.data for bite in bites] == [
+            b"val1,val2\r\na,a\r\n",
+            b"val1,val2\r\nb,b\r\n",
+        ]
+
+    @pytest.mark.unit_test
+    @mock.patch("looker.get_data.Looker.looker_get_headers")
+    @mock.patch("looker.get_data.time.sleep")
+    @mock.patch("looker.get_data.requests.request")
+    def test_when_query_task_is_running_then_polls_with_backoff_until_complete(
+        self, mock_requests_request, mock_sleep, mock_get_headers
+    ):
+        mock_get_headers.return_value = self.fake_headers
+        mock_requests_request.side_effect = [
+            MockResponse(json_data={"status": "added"}, status_code=200),
+            MockResponse(json_data={"status": "running"}, status_code=200),
+            MockResponse(json_data={"status": "complete"}, status_code=200),
+        ]
+
+        self.lk.looker_wait_for_query_task("fake_task_id", 60)
+
+        assert mock_requests_request.call_count == 3
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [0.5, 1]
+
+    @pytest.mark.unit_test
+    @mock.patch("looker.get_data.Looker.looker_login")
+    @mock.patch("looker.get_data.time.sleep")
+    @mock.patch("looker.get_data.requests.request")
+    def test_when_token_expires_while_polling_then_next_poll_uses_new_token(
+        self, mock_requests_request, mock_sleep, mock_login
+    ):
+        new_headers = {"authorization": "Bearer new_token"}
+        mock_login.return_value = new_headers
+        self.lk._headers = self.fake_headers
+        self.lk._token_expires_at = time.monotonic() + 3600
+        mock_requests_request.side_effect = [
+            MockResponse(json_data={"status": "running"}, status_code=200),
+            MockResponse(json_data={"status": "complete"}, status_code=200),
+        ]
+
+        def expire_token(interval):
+            self.lk._token_expires_at = 0
+
+        mock_sleep.side_effect = expire_token
+
+        self.lk.looker_wait_for_query_task("fake_task_id", 60)
+
+        headers = [c.kwargs["headers"] for c in mock_requests_request.call_args_list]
+        assert headers == [self.fake_headers, new_headers]
+        assert mock_login.call_count == 1
+
+    @pytest.mark.unit_test
+    @mock.patch("looker.get_data.Looker.looker_get_headers")
+    @mock.patch("looker.get_data.time.sleep")
+    @mock.patch("looker.get_data.requests.request")
+    def test_when_query_task_fails_then_raises_runtime_error(
+        self, mock_requests_request, mock_sleep, mock_get_headers
+    ):
+        mock_get_headers.return_value = self.fake_headers
+        mock_requests_request.return_value = MockResponse(
+            json_data={"status": "error"}, status_code=200
         )
 
-        assert type(data) == list
-        for i in data:
-            assert type(i) == dict
+        with self.assertRaises(RuntimeError):
+            self.lk.looker_wait_for_query_task("fake_task_id", 60)
 
     @pytest.mark.unit_test
     def test_when_set_last_run_time_called_with_not_datetime_type_then_raises_exception(
@@ -1,8 +1,14 @@
 import datetime
 import looker_sdk
+from looker_sdk.rtl.serialize import converter40
 import logging
 
 from bagel import Bagel, BagelIntegration, Bite, Table
+from bagel.concurrency import bounded_map
+from bagel.util import batched
+
+# dashboards without an `updated_at` are treated as last updated at this time
+DEFAULT_UPDATED_AT = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,6 +19,12 @@ logging.basicConfig(
 class Looker_SDK(BagelIntegration):
 
     source = "looker_sdk"
+    # detail calls made at once; tables.yaml `concurrency` overrides it
+    concurrency = 8
+    # rows per Bite; tables.yaml `batch_size` overrides it
+    batch_size = 500
+    # dashboards per `search_dashboards` page
+    page_size = 1000
 
     def __post_init__(self) -> None:
         self._load_config()
@@ -27,41 +39,73 @@ class Looker_SDK(BagelIntegration):
 
         return getattr(self, table.name)(table, last_run_timestamp, current_timestamp)
 
-    def all_users(self, *args, **kwargs):
+    def _all_users(self):
+        """`all_users` and `user_attributes` share one user list per run."""
+        return self.cache.get_or_compute("all_users", self.sdk.all_users)
+
+    def _to_rows(self, models):
+        """SDK models as the dicts the API returns, nested models and datetimes included"""
+        return [converter40.unstructure(model) for model in models]
+
+    def _batch_bites(self, table, rows):
+        batch_size = table.get_option("batch_size", self.batch_size)
+        for batch in batched(rows, batch_size):
+            yield Bite(batch)
+
+    def all_users(self, table, *args, **kwargs):
         """gets all user's data"""
-        all_users = self.sdk.all_users()
-        for user in all_users:
-            yield Bite([user.__dict__])
-
-    def user_attributes(self, *args, **kwargs):
-        """gets all users, then loops through each user getting their attributes."""
-        all_users = self.sdk.all_users()
-        for user in all_users:
-            user_attribtues_data = []
-            user_attribtues = self.sdk.user_attribute_user_values(user_id=user.id)
-            for attribute in user_attribtues:
-                user_attribtues_data.append(attribute.__dict__)
-            yield Bite(user_attribtues_data)
+        yield from self._batch_bites(table, self._to_rows(self._all_users()))
+
+    def _user_attribute_rows(self, user_id):
+        return self._to_rows(self.sdk.user_attribute_user_values(user_id=user_id))
+
+    def user_attributes(self, table, *args, **kwargs):
+        """gets all users, then gets their attributes concurrently. Each row has
+        its user's `user_id`, a field of `UserAttributeWithValue`."""
+        user_ids = [user.id for user in self._all_users()]
+        concurrency = table.get_option("concurrency", self.concurrency)
+        results = bounded_map(
+            self._user_attribute_rows, user_ids, concurrency, ordered=False
+        )
+        rows = (row for user_rows in results for row in user_rows)
+        yield from self._batch_bites(table, rows)
+
+    def _search_dashboards(self):
+        """yields the id and `updated_at` of every dashboard, a page at a time"""
+        offset = 0
+        while True:
+            page = self.sdk.search_dashboards(
+                fields="id,updated_at",
+                deleted="false",
+                sorts="id",
+                limit=self.page_size,
+                offset=offset,
+            )
+            yield from page
+            if len(page) < self.page_size:
+                return
+            offset += self.page_size
 
     def all_dashboards(self, table, last_run_timestamp, current_timestamp):
-        """gets all dashboard data"""
-        all_dashboards = self.sdk.all_dashboards()
-        for dashboardBase in all_dashboards:
-            dashboard = self.sdk.dashboard(dashboard_id=dashboardBase.id)
-            updated_time = dashboard.updated_at or datetime.datetime(
-                2022, 1, 1, tzinfo=datetime.timezone.utc
-            )
+        """gets the data of dashboards updated in the window. The search call
+        returns `updated_at`, so details are only fetched for those dashboards."""
+        dashboard_ids = []
+        for dashboard in self._search_dashboards():
+            updated_time = dashboard.updated_at or DEFAULT_UPDATED_AT
             if (
                 updated_time.timestamp() >= last_run_timestamp.timestamp()
                 and updated_time.timestamp() <= current_timestamp.timestamp()
             ):
-                yield Bite([dashboard.__dict__])
+                dashboard_ids.append(dashboard.id)
+
+        concurrency = table.get_option("concurrency", self.concurrency)
+        dashboards = bounded_map(self.sdk.dashboard, dashboard_ids, concurrency)
+        rows = (converter40.unstructure(dashboard) for dashboard in dashboards)
+        yield from self._batch_bites(table, rows)
 
-    def all_folders(self, *args, **kwargs):
+    def all_folders(self, table, *args, **kwargs):
         """gets all folder data"""
-        all_folders = self.sdk.all_folders()
-        for folder in all_folders:
-            yield Bite([folder.__dict__])
+        yield from self._batch_bites(table, self._to_rows(self.sdk.all_folders()))
 
 
 if __name__ == "__main__":
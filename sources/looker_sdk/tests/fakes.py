@@ -0,0 +1,60 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+# stands in for `looker_sdk.rtl.serialize.converter40`
+fake_converter = SimpleNamespace(unstructure=asdict)
+
+
+@dataclass
+class FakeDashboard:
+    id: str
+    updated_at: Optional[datetime] = None
+    title: Optional[str] = None
+
+
+@dataclass
+class FakeUser:
+    id: str
+
+
+@dataclass
+class FakeUserAttributeWithValue:
+    user_id: str
+    name: str
+    value: str
+
+
+class FakeLookerSDK:
+    """Answers the Looker 4.0 SDK calls made by `Looker_SDK`. `search_dashboards`
+    returns only the requested fields, `limit` at a time from `offset`."""
+
+    def __init__(self, dashboards=(), user_attributes=None):
+        self.dashboards = {d.id: d for d in dashboards}
+        # user id -> names of the attributes that user has a value for
+        self.user_attributes = user_attributes or {}
+        self.searches = []
+        self.dashboard_calls = []
+        self.attribute_calls = []
+
+    def all_users(self):
+        return [FakeUser(user_id) for user_id in self.user_attributes]
+
+    def user_attribute_user_values(self, user_id):
+        self.attribute_calls.append(user_id)
+        return [
+            FakeUserAttributeWithValue(user_id, name, f"{name}-{user_id}")
+            for name in self.user_attributes[user_id]
+        ]
+
+    def search_dashboards(self, fields, deleted, sorts, limit, offset):
+        self.searches.append((limit, offset))
+        assert (fields, deleted, sorts) == ("id,updated_at", "false", "id")
+
+        page = sorted(self.dashboards.values(), key=lambda d: d.id)
+        return [FakeDashboard(d.id, d.updated_at) for d in page[offset:][:limit]]
+
+    def dashboard(self, dashboard_id):
+        self.dashboard_calls.append(dashboard_id)
+        return self.dashboards[dashboard_id]
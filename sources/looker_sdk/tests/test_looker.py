@@ -1,2 +1,122 @@
+import importlib.util
+import sys
+import types
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from bagel.table import Table
+
+from .fakes import FakeDashboard, FakeLookerSDK, fake_converter
+
+
 def test_function():
     assert True
+
+
+def load_get_data():
+    """This source's `looker_sdk` package shadows the Looker SDK it imports, so
+    get_data.py is loaded against stand-ins for the SDK modules."""
+    serialize = types.ModuleType("looker_sdk.rtl.serialize")
+    serialize.converter40 = fake_converter
+    sdk_modules = {
+        "looker_sdk": types.SimpleNamespace(init40=FakeLookerSDK),
+        "looker_sdk.rtl": types.ModuleType("looker_sdk.rtl"),
+        "looker_sdk.rtl.serialize": serialize,
+    }
+
+    spec = importlib.util.spec_from_file_location(
+        "looker_sdk_get_data", Path(__file__).parents[1] / "get_data.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, sdk_modules):
+        spec.loader.exec_module(module)
+    return module
+
+
+get_data = load_get_data()
+
+
+@pytest.fixture
+def looker():
+    return get_data.Looker_SDK()
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.unit_test
+def test_when_dashboards_are_searched_then_only_updated_ones_are_fetched(looker):
+    looker.sdk = FakeLookerSDK(
+        [
+            FakeDashboard("1", utc(2024, 1, 1), "old"),
+            FakeDashboard("2", utc(2024, 1, 2, 12), "updated"),
+            FakeDashboard("3", None, "never updated"),
+            FakeDashboard("4", utc(2024, 1, 3), "updated"),
+        ]
+    )
+
+    bites = list(
+        looker.all_dashboards(Table("all_dashboards"), utc(2024, 1, 2), utc(2024, 1, 3))
+    )
+
+    assert looker.sdk.dashboard_calls == ["2", "4"]
+    assert [row["title"] for bite in bites for row in bite.data] == [
+        "updated",
+        "updated",
+    ]
+
+
+@pytest.mark.unit_test
+def test_when_search_page_is_short_then_paging_stops(looker):
+    looker.page_size = 2
+    looker.sdk = FakeLookerSDK(
+        [FakeDashboard(str(i), utc(2024, 1, 2)) for i in range(5)]
+    )
+
+    ids = [dashboard.id for dashboard in looker._search_dashboards()]
+
+    assert ids == ["0", "1", "2", "3", "4"]
+    assert looker.sdk.searches == [(2, 0), (2, 2), (2, 4)]
+
+
+@pytest.mark.unit_test
+def test_when_last_search_page_is_full_then_one_empty_page_ends_paging(looker):
+    looker.page_size = 2
+    looker.sdk = FakeLookerSDK(
+        [FakeDashboard(str(i), utc(2024, 1, 2)) for i in range(4)]
+    )
+
+    assert len(list(looker._search_dashboards())) == 4
+    assert looker.sdk.searches == [(2, 0), (2, 2), (2, 4)]
+
+
+@pytest.mark.unit_test
+def test_when_user_attributes_are_fetched_then_every_users_rows_arrive(looker):
+    looker.sdk = FakeLookerSDK(
+        user_attributes={
+            str(i): ["email", "locale", "team"][: i % 4] for i in range(20)
+        }
+    )
+
+    bites = list(looker.user_attributes(Table("user_attributes")))
+
+    rows = [row for bite in bites for row in bite.data]
+    assert sorted(looker.sdk.attribute_calls, key=int) == [str(i) for i in range(20)]
+    assert len(rows) == sum(i % 4 for i in range(20))
+    assert all(row["value"] == f"{row['name']}-{row['user_id']}" for row in rows)
+
+
+@pytest.mark.unit_test
+def test_when_user_attributes_are_fetched_then_bites_hold_batch_size_rows(looker):
+    looker.sdk = FakeLookerSDK(
+        user_attributes={str(i): ["email", "locale"] for i in range(6)}
+    )
+    table = Table.from_config({"name": "user_attributes", "batch_size": 5})
+
+    bites = list(looker.user_attributes(table))
+
+    assert [len(bite.data) for bite in bites] == [5, 5, 2]
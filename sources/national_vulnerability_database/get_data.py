@@ -1,8 +1,17 @@
+from contextlib import closing
 import os
+import random
 import time
 import requests
 import logging
+from requests.adapters import HTTPAdapter
 from bagel import Bagel, BagelIntegration, Bite, Table
+from bagel.concurrency import RateLimiter, bounded_map
+
+# transient errors NVD returns under load, retried with backoff
+RETRY_STATUS_CODES = [503, 403, 504]
+# largest `resultsPerPage` each endpoint accepts
+PAGE_SIZES = {"cves": 2000, "cpes": 10000, "cpematch": 5000, "source": 1000}
 
 logging.basicConfig(
     level=logging.WARNING,
@@ -12,95 +21,172 @@ logging.basicConfig(
 
 class NationalVulnerabilityDatabase(BagelIntegration):
     source = "national_vulnerability_database"
+    # NVD allows 50 requests in a rolling 30 seconds with an API key and 5 without one
+    rate_limit_period = 30
+    rate_limit_with_key = 50
+    rate_limit_without_key = 5
+    # pages requested at once; tables.yaml `concurrency` overrides it
+    concurrency = 5
+    max_retries = 5
+    backoff_base = 2
+    backoff_max = 240
 
     def __post_init__(self) -> None:
         self._load_config()
         self.base_url = "https://services.nvd.nist.gov/rest/json/"
+        self.session = self.nvd_get_session()
 
     def _load_config(self):
         self._auth_secret = os.getenv("NATIONAL_VULNERABILITY_DATABASE_SECRET")
+        # one limiter for every request of the run, whichever table or thread makes it
+        self.rate_limiter = RateLimiter(
+            self.rate_limit_with_key
+            if self._auth_secret
+            else self.rate_limit_without_key,
+            self.rate_limit_period,
+        )
+
+    def nvd_get_session(self):
+        # a kept-alive connection per concurrent page, instead of a new one per request
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.concurrency)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
 
     def get_data(self, table: Table, last_run_timestamp, current_timestamp):
+        # a window that failed part way resumes after the last page that landed
+        start_index = (table.resume_state or {}).get("start_index", 0)
+
+        page_size = self.nvd_get_page_size(table)
+
         self.next_url = self.nvd_get_url(
-            table.name, last_run_timestamp, current_timestamp, 0
+            table.name, last_run_timestamp, current_timestamp, start_index, page_size
+        )
+        data, results_per_page, total_results = self.nvd_get_page(
+            self.next_url, start_index
         )
-        data, results_per_page, total_results = self.nvd_get_data(self.next_url)
 
-        index = results_per_page
+        index = start_index + results_per_page
         logging.info("Total Results: " + str(total_results))
         logging.info("Results Per Page: " + str(results_per_page))
-        if total_results == 0:
+        if total_results == 0 or data == []:
             return None
         else:
-            yield Bite(data)
+            yield Bite(data, checkpoint={"start_index": index})
+
+        if results_per_page == 0:
+            return None
 
-        while index < total_results:
-            self.next_url = self.nvd_get_url(
-                table.name, last_run_timestamp, current_timestamp, index
+        # the first page tells us every page's startIndex (the server can cap the page
+        # size we asked for, so its `resultsPerPage` is used), so the rest are fetched
+        # concurrently within the rate limit and still yielded in order
+        def get_page(page_index):
+            url = self.nvd_get_url(
+                table.name, last_run_timestamp, current_timestamp, page_index, page_size
             )
-            data, results_per_page, total_results = self.nvd_get_data(self.next_url)
-            if data == []:
-                logging.error(
-                    "Failed to complete processing at "
-                    + str(index)
-                    + " / "
-                    + str(total_results)
-                    + " results"
-                )
-                break
-            else:
-                yield Bite(data)
-                index = index + results_per_page
+            return page_index, self.nvd_get_page(url, page_index)
+
+        concurrency = table.get_option("concurrency", self.concurrency)
+        page_indexes = range(index, total_results, results_per_page)
+
+        with closing(bounded_map(get_page, page_indexes, concurrency)) as pages:
+            for page_index, (data, results_per_page, total_results) in pages:
+                index = page_index + results_per_page
+                yield Bite(data, checkpoint={"start_index": index})
         return None
 
-    def nvd_get_url(self, table_name, last_run_timestamp, current_timestamp, index):
+    def nvd_get_page_size(self, table: Table):
+        """tables.yaml `page_size`, or the largest page the endpoint allows."""
+        return table.get_option("page_size", PAGE_SIZES.get(table.name))
+
+    def nvd_get_page(self, url, page_index):
+        """Gets a page that must have results. NVD sometimes answers with an empty
+        page before `totalResults` is reached; that page alone is retried, and the
+        window fails (to resume from its checkpoint) rather than being cut short."""
+        retry_count = 0
+        data, results_per_page, total_results = self.nvd_get_data(url)
+
+        while data == [] and page_index < total_results:
+            if retry_count >= self.max_retries:
+                raise RuntimeError(
+                    f"Empty page at {page_index} / {total_results} results after {retry_count} retries: {url}"
+                )
+
+            sleep_time = self.nvd_get_backoff(retry_count)
+            logging.warning(
+                f"Empty page at {page_index} / {total_results} results: sleeping for {sleep_time:.1f} seconds and then retrying... "
+            )
+            time.sleep(sleep_time)
+            retry_count += 1
+            data, results_per_page, total_results = self.nvd_get_data(url)
+
+        return data, results_per_page, total_results
+
+    def nvd_get_url(
+        self,
+        table_name,
+        last_run_timestamp,
+        current_timestamp,
+        index,
+        results_per_page=None,
+    ):
         last_run_timestamp = last_run_timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fz")
         current_timestamp = current_timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fz")
         since = f"lastModStartDate={last_run_timestamp}"
         until = f"lastModEndDate={current_timestamp}"
         startIndex = f"startIndex={index}"
-        url = f"{self.base_url}{table_name}/2.0?{since}&{until}&{startIndex}"
+        url = f"{self.base_url}{table_name}/2.0?{since}&{until}"
+        if results_per_page:
+            url += f"&resultsPerPage={results_per_page}"
+        url += f"&{startIndex}"
         return url
 
-    def nvd_get_data(self, url):
-        logging.info(f"url: {url}")
+    def nvd_get_header(self):
         header = {
             "Content-Type": "application/json",
             "Accept": "application/json",
-            "Basic": "{self._auth_secret}",
         }
+        if self._auth_secret:
+            header["apiKey"] = self._auth_secret
+        return header
+
+    def nvd_get_backoff(self, retry_count):
+        """Exponential backoff with full jitter, so concurrent retries spread out."""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**retry_count)
+        )
+
+    def nvd_request(self, url, header):
+        self.rate_limiter.acquire()
+        return self.session.get(url, headers=header)
+
+    def nvd_get_data(self, url):
+        logging.info(f"url: {url}")
+        header = self.nvd_get_header()
         results_per_page = 0
         total_results = 0
         retry_count = 0
-        max_retries = 5
         data = []
-        time.sleep(6)
-        response = requests.get(url, headers=header)
+        response = self.nvd_request(url, header)
 
         # Despite following the best practices from the documentation, it still returns a internal errors sometimes. Retries seem to help
-        if response.status_code in [503, 403, 504]:
-            while retry_count < max_retries:
-                response = requests.get(url, headers=header)
-                if response.status_code in [503, 403, 504]:
-                    if retry_count < max_retries:
-                        if retry_count < 5:
-                            sleep_time = 30
-                        else:
-                            sleep_time = 240
-                        logging.warning(
-                            f"Error ({response.status_code}): sleeping for {sleep_time} seconds and then retrying... "
-                        )
-                        time.sleep(sleep_time)
-                        retry_count += 1
-                    else:
-                        logging.error(
-                            f"Maximum amount of retries succeeded: {response.text}"
-                        )
-                        raise RuntimeError(
-                            f"ERROR running {url}\n{response.status_code = }\n{response.text}"
-                        )
-                else:
-                    break
+        while response.status_code in RETRY_STATUS_CODES:
+            if retry_count >= self.max_retries:
+                logging.error(f"Maximum amount of retries succeeded: {response.text}")
+                raise RuntimeError(
+                    f"ERROR running {url}\n{response.status_code = }\n{response.text}"
+                )
+
+            sleep_time = self.nvd_get_backoff(retry_count)
+            logging.warning(
+                f"Error ({response.status_code}): sleeping for {sleep_time:.1f} seconds and then retrying... "
+            )
+            time.sleep(sleep_time)
+            retry_count += 1
+            response = self.nvd_request(url, header)
 
         if response.status_code != 200:
             logging.error(response.text)
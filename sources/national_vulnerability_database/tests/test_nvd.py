@@ -5,6 +5,7 @@ from unittest import mock
 from bagel.table import Table
 from national_vulnerability_database.get_data import NationalVulnerabilityDatabase
 from .fakes import (
+    MockResponse,
     mock_get_url,
     mock_get_request_200,
     mock_get_request_404,
@@ -35,7 +36,7 @@ class TestNVD(unittest.TestCase):
 
     @pytest.mark.unit_test
     @mock.patch("national_vulnerability_database.get_data.time.sleep")
-    @mock.patch("national_vulnerability_database.get_data.requests.get")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
     def test_when_api_errors_then_raise_runtime_error(
         self, mock_requests_get, mock_sleep
     ):
@@ -47,7 +48,7 @@ class TestNVD(unittest.TestCase):
 
     @pytest.mark.unit_test
     @mock.patch("national_vulnerability_database.get_data.time.sleep")
-    @mock.patch("national_vulnerability_database.get_data.requests.get")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
     def test_when_api_returns_403_then_raise_runtime_error(
         self, mock_requests_get, mock_sleep
     ):
@@ -60,7 +61,7 @@ class TestNVD(unittest.TestCase):
 
     @pytest.mark.unit_test
     @mock.patch("national_vulnerability_database.get_data.time.sleep")
-    @mock.patch("national_vulnerability_database.get_data.requests.get")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
     def test_when_api_returns_403_then_the_api_is_called_twice(
         self, mock_requests_get, mock_sleep
     ):
@@ -73,7 +74,7 @@ class TestNVD(unittest.TestCase):
 
     @pytest.mark.unit_test
     @mock.patch("national_vulnerability_database.get_data.time.sleep")
-    @mock.patch("national_vulnerability_database.get_data.requests.get")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
     def test_when_api_returns_503_then_the_api_is_called_twice(
         self, mock_requests_get, mock_sleep
     ):
@@ -109,7 +110,7 @@ class TestNVD(unittest.TestCase):
 
     @pytest.mark.unit_test
     @mock.patch("national_vulnerability_database.get_data.time.sleep")
-    @mock.patch("national_vulnerability_database.get_data.requests.get")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
     def test_when_get_data_response_does_not_contain_paging_details(
         self, mock_requests_get, mock_sleep
     ):
@@ -124,7 +125,7 @@ class TestNVD(unittest.TestCase):
 
     @pytest.mark.unit_test
     @mock.patch("national_vulnerability_database.get_data.time.sleep")
-    @mock.patch("national_vulnerability_database.get_data.requests.get")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
     def test_when_get_data_has_no_results_then_exits_successfully(
         self, mock_requests_get, mock_sleep
     ):
@@ -139,6 +140,119 @@ class TestNVD(unittest.TestCase):
         except:
             pytest.fail("Unexpected error in get_data()")
 
+    @pytest.mark.unit_test
+    @mock.patch("national_vulnerability_database.get_data.time.sleep")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
+    def test_when_window_is_resumed_then_start_after_last_checkpoint(
+        self, mock_requests_get, mock_sleep
+    ):
+        mock_requests_get.return_value = MockResponse(
+            json_data={
+                "totalResults": "6",
+                "resultsPerPage": "2",
+                "vulnerabilities": [{"val1": "b"}, {"val1": "c"}],
+            },
+            status_code=200,
+        )
+        mock_sleep.side_effect = mock_time_sleep()
+        table = Table(name="cves")
+        table.resume_state = {"start_index": 2}
+
+        result = list(
+            self.nvd.get_data(table, self.last_run_timestamp, self.current_timestamp)
+        )
+
+        urls = [c.args[0] for c in mock_requests_get.call_args_list]
+        assert [u.rsplit("startIndex=", 1)[1] for u in urls] == ["2", "4"]
+        assert [b.checkpoint for b in result] == [
+            {"start_index": 4},
+            {"start_index": 6},
+        ]
+
+    @pytest.mark.unit_test
+    @mock.patch("national_vulnerability_database.get_data.time.sleep")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
+    def test_when_page_is_empty_before_total_then_only_that_page_is_retried(
+        self, mock_requests_get, mock_sleep
+    ):
+        def page(rows):
+            return MockResponse(
+                json_data={
+                    "totalResults": "4",
+                    "resultsPerPage": "2",
+                    "vulnerabilities": rows,
+                },
+                status_code=200,
+            )
+
+        mock_requests_get.side_effect = [
+            page([{"val1": "a"}, {"val1": "b"}]),
+            page([]),
+            page([{"val1": "c"}, {"val1": "d"}]),
+        ]
+
+        result = list(
+            self.nvd.get_data(
+                Table(name="cves"), self.last_run_timestamp, self.current_timestamp
+            )
+        )
+
+        urls = [c.args[0] for c in mock_requests_get.call_args_list]
+        assert all("resultsPerPage=2000" in u for u in urls)
+        assert [u.rsplit("startIndex=", 1)[1] for u in urls] == ["0", "2", "2"]
+        assert [len(b.data) for b in result] == [2, 2]
+
+    @pytest.mark.unit_test
+    @mock.patch("national_vulnerability_database.get_data.time.sleep")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
+    def test_when_page_stays_empty_before_total_then_raise(
+        self, mock_requests_get, mock_sleep
+    ):
+        mock_requests_get.return_value = MockResponse(
+            json_data={"totalResults": "4", "resultsPerPage": "2", "array": []},
+            status_code=200,
+        )
+
+        with self.assertRaises(RuntimeError):
+            self.nvd.nvd_get_page("foo", 2)
+
+        assert mock_requests_get.call_count == self.nvd.max_retries + 1
+
+    @pytest.mark.unit_test
+    @mock.patch("national_vulnerability_database.get_data.time.sleep")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
+    def test_when_requesting_then_api_key_header_is_sent(
+        self, mock_requests_get, mock_sleep
+    ):
+        mock_requests_get.return_value = mock_get_request()
+
+        self.nvd.nvd_get_data("foo")
+
+        headers = mock_requests_get.call_args.kwargs["headers"]
+        assert headers["apiKey"] == self._auth_secret
+        assert "Basic" not in headers
+        mock_sleep.assert_not_called()
+
+    @pytest.mark.unit_test
+    @mock.patch("national_vulnerability_database.get_data.time.sleep")
+    @mock.patch("national_vulnerability_database.get_data.requests.Session.get")
+    def test_when_retrying_then_backoff_grows_with_jitter(
+        self, mock_requests_get, mock_sleep
+    ):
+        mock_requests_get.side_effect = [
+            mock_get_request_503(),
+            mock_get_request_503(),
+            mock_get_request_503(),
+            mock_get_request(),
+        ]
+
+        self.nvd.nvd_get_data("foo")
+
+        sleeps = [c.args[0] for c in mock_sleep.call_args_list]
+        assert len(sleeps) == 3
+        for retry_count, sleep_time in enumerate(sleeps):
+            assert 0 <= sleep_time <= self.nvd.backoff_base * 2**retry_count
+
     @pytest.mark.unit_test
     @mock.patch(
         "national_vulnerability_database.get_data.NationalVulnerabilityDatabase._load_config"
@@ -147,3 +261,11 @@ class TestNVD(unittest.TestCase):
         NationalVulnerabilityDatabase()
 
         assert mock_load_config.called
+
+    @pytest.mark.unit_test
+    def test_when_session_created_then_pool_has_a_connection_per_concurrent_page(
+        self,
+    ):
+        adapter = self.nvd.session.get_adapter(self.nvd.base_url)
+
+        assert adapter._pool_maxsize == self.nvd.concurrency
@@ -3,6 +3,7 @@ import time
 import logging
 import pendulum
 import requests
+from urllib.parse import parse_qs, quote, urlparse
 
 from bagel import Bagel, BagelIntegration, Bite, Table
 
@@ -25,12 +26,20 @@ class Okta(BagelIntegration):
         self._auth_secret = os.getenv("OKTA_SECRET")
 
     def get_data(self, table: Table, last_run_timestamp, current_timestamp):
+        """Polls the log from the `after` cursor saved by the last run, or from
+        `last_run_timestamp` on the first one, until a page comes back empty.
+        The `after` of the last next link is kept in `table.state`, which Bagel
+        saves for the next run, so no time range is scanned twice."""
 
         table_name = table.name
 
-        self.next_url = self.okta_get_url(
-            table_name, last_run_timestamp, current_timestamp
-        )
+        # a window that failed part way resumes after the last page that landed
+        cursor = (table.resume_state or {}).get("after") or table.state.get("after")
+        if cursor:
+            self.next_url = self.okta_get_cursor_url(table_name, cursor)
+        else:
+            self.next_url = self.okta_get_url(table_name, last_run_timestamp)
+
         rate_limit = -1
         while self.next_url:
             data_log_details = {}
@@ -42,17 +51,38 @@ class Okta(BagelIntegration):
             data, self.next_url, rate_limit, next_reset_epoch = self.okta_get_data(
                 self.next_url
             )
-            yield Bite(data)
+
+            # an empty page means we've caught up; its link is where the next run resumes
+            if not data:
+                break
+
+            cursor = self.okta_get_cursor(self.next_url)
+            if cursor:
+                table.state["after"] = cursor
+
+            yield Bite(data, checkpoint={"after": cursor} if cursor else None)
+
         return None
 
-    def okta_get_url(self, table_name, last_run_timestamp, current_timestamp):
+    def okta_get_url(self, table_name, last_run_timestamp):
+        # no `until`: a polling request, whose next link is always returned so it can be resumed
         last_run_timestamp = last_run_timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fz")
-        current_timestamp = current_timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fz")
         since = f"since={last_run_timestamp}"
-        until = f"until={current_timestamp}"
-        url = f"{self.base_url}{table_name}?{since}&{until}&limit=1000"
+        url = f"{self.base_url}{table_name}?{since}&limit=1000&sortOrder=ASCENDING"
+        return url
+
+    def okta_get_cursor_url(self, table_name, cursor):
+        after = f"after={quote(cursor)}"
+        url = f"{self.base_url}{table_name}?{after}&limit=1000&sortOrder=ASCENDING"
         return url
 
+    def okta_get_cursor(self, url):
+        """Returns the opaque `after` parameter of a next link, if it has one."""
+        if not url:
+            return None
+        after = parse_qs(urlparse(url).query).get("after")
+        return after[0] if after else None
+
     def okta_get_data(self, url):
 
         logging.info(f"url: {url}")